@@ -1,12 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
+import orjson
 from datetime import datetime, timedelta
 from functools import wraps
+import base64
+from operator import attrgetter
+import hashlib
+import hmac
+import itertools
 import sqlite3
+import time
 from news_database import NewsDatabase
-from supabase_database import SupabaseDatabase
+from connection_pool import ConnectionPool
+from ttl_cache import TTLCache
+from supabase_database import SupabaseDatabase, pgvector_literal
 from dotenv import load_dotenv
 import os
 from news_scraper import NewsScraper
@@ -16,17 +26,58 @@ import logging
 # Load environment variables
 load_dotenv()
 
+class OrjsonProvider(JSONProvider):
+    """Encode jsonify() responses with orjson, which also writes datetimes as ISO 8601 natively"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Same argument rules as JSONProvider.response: one value as is, several as a list, kwargs as a dict
+        if args and kwargs:
+            raise TypeError("app.json.response() takes either args or kwargs, not both")
+        obj = kwargs or (args[0] if len(args) == 1 else list(args) or None)
+        # Skip the bytes -> str -> bytes round trip that dumps() would need
+        body = orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        return self._app.response_class(body, mimetype='application/json')
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)  # Enable CORS for all routes
 
 # Configuration
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-this-in-production')
 app.config['JWT_EXPIRATION_DELTA'] = timedelta(hours=24)
+# Pin the password hashing cost instead of following Werkzeug's default, which has grown between
+# releases; check_password_hash reads the method from each stored hash, so old hashes still verify
+app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# In-process auth caches: verified tokens (keyed by the token's SHA-256, kept no longer than
+# the token's own expiry) and recent successful logins (keyed by username, holding an HMAC of
+# the password rather than the password itself)
+session_cache = TTLCache(maxsize=10000, ttl=15 * 60)
+login_cache = TTLCache(maxsize=10000, ttl=5 * 60)
+# Recently failed (username, password HMAC) pairs, so replayed bad credentials skip the hash check
+failed_login_cache = TTLCache(maxsize=10000, ttl=5 * 60)
+_credential_key = app.config['SECRET_KEY'].encode()
+# Verified in place of a real hash when there is no account to check against, so a failed
+# login costs the same whether or not the username exists
+_DUMMY_HASH = generate_password_hash('x' * 16, method=app.config['PASSWORD_HASH_METHOD'])
+# Compared against on a cached rejection, so that path does the same MAC work as a cache hit
+_DUMMY_MAC = hmac.new(_credential_key, b'', hashlib.sha256).digest()
+USERNAME_MAX_LENGTH = 64
+# Article fields exposed by the article list endpoints, read in one C-level call per article
+_ARTICLE_FIELDS = ('title', 'url', 'description', 'published_date', 'source', 'category')
+_article_fields = attrgetter(*_ARTICLE_FIELDS)
+_SCORED_ARTICLE_FIELDS = _ARTICLE_FIELDS + ('relevance_score',)
+
 # Initialize database - use Supabase if configured, fallback to SQLite
 use_supabase = os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_PUBLISHABLE_KEY')
 if use_supabase:
@@ -35,16 +86,62 @@ if use_supabase:
 else:
     logger.info("Using SQLite database")
     db = NewsDatabase()
+    # Request handlers borrow long-lived connections instead of opening one per call
+    pool = ConnectionPool(db.connect)
+
+# SQLite statements used by the request handlers. The pooled connections live for the whole
+# process, so each one's statement cache prepares these once and reuses them afterwards
+_Q_USER_BY_USERNAME = 'SELECT id, username, email, password_hash FROM users WHERE username = ?'
+_Q_INSERT_USER = 'INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)'
+_Q_SELECT_PREF_BY_ID = 'SELECT id, description, weight FROM user_preferences WHERE id = ? AND user_id = ?'
+_Q_UPDATE_PREF_WEIGHT = 'UPDATE user_preferences SET weight = ? WHERE id = ? AND user_id = ?'
+_Q_UPDATE_PREF = '''
+    UPDATE user_preferences
+    SET description = ?, weight = ?, embedding = ?
+    WHERE id = ? AND user_id = ?
+'''
+_Q_SELECT_PREF_DESCRIPTION = 'SELECT description FROM user_preferences WHERE id = ? AND user_id = ?'
+_Q_DELETE_PREF = 'DELETE FROM user_preferences WHERE id = ? AND user_id = ?'
+_Q_CLEAR_PREFS = 'DELETE FROM user_preferences WHERE user_id = ?'
+# JSON1 renders each entry, so the rows can be spliced into the response body as-is
+_Q_READING_HISTORY_JSON = '''
+    SELECT json_object('title', a.title, 'url', a.url, 'source', a.source,
+                       'action', rh.action, 'timestamp', rh.timestamp)
+    FROM reading_history rh
+    JOIN articles a ON rh.article_id = a.id
+    WHERE rh.user_id = ?
+    ORDER BY rh.timestamp DESC
+    LIMIT 100
+'''
 
 scraper = NewsScraper(db)
 
 # Start background news scraping
+scheduler_instance = None
 try:
     scheduler_instance = start_background_scraping()
     logger.info("Background news scraping started - articles will be scraped every 2 hours")
 except Exception as e:
     logger.error(f"Failed to start background scraping: {e}")
 
+# HS256 signing state prepared once: the fixed JOSE header and a keyed HMAC copied per token
+_JWT_HEADER = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b'=')
+_jwt_hmac = hmac.new(app.config['SECRET_KEY'].encode(), digestmod=hashlib.sha256)
+# exp is a plain unix timestamp, so issuing a token needs no datetime arithmetic
+EXP_SECONDS = int(app.config['JWT_EXPIRATION_DELTA'].total_seconds())
+
+def encode_token(user_id, username):
+    """Issue an HS256 JWT for the user, equivalent to jwt.encode() without its per-call setup"""
+    payload = base64.urlsafe_b64encode(orjson.dumps({
+        'user_id': user_id,
+        'username': username,
+        'exp': int(time.time()) + EXP_SECONDS
+    })).rstrip(b'=')
+    signing_input = _JWT_HEADER + b'.' + payload
+    signer = _jwt_hmac.copy()
+    signer.update(signing_input)
+    return (signing_input + b'.' + base64.urlsafe_b64encode(signer.digest()).rstrip(b'=')).decode()
+
 def token_required(f):
     """Decorator to require JWT token for protected routes"""
     @wraps(f)
@@ -59,9 +156,14 @@ def token_required(f):
             if token.startswith('Bearer '):
                 token = token[7:]
             
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user_id = data['user_id']
-            current_username = data['username']
+            # Tokens verified recently skip signature checking and JSON decoding
+            token_key = hashlib.sha256(token.encode()).digest()
+            session = session_cache.get(token_key)
+            if session is None:
+                data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+                session = (data['user_id'], data['username'])
+                session_cache.set(token_key, session, ttl=min(data['exp'] - time.time(), session_cache.ttl))
+            current_user_id, current_username = session
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token has expired'}), 401
         except jwt.InvalidTokenError:
@@ -71,11 +173,45 @@ def token_required(f):
     
     return decorated
 
+def _valid_username(username):
+    """Whether a new account may use this username: 3-64 ASCII letters, digits, '_', '-' or '.'"""
+    return (3 <= len(username) <= USERNAME_MAX_LENGTH and username.isascii()
+            and all(c.isalnum() or c in '_-.' for c in username))
+
 def get_user_by_credentials(username, password):
     """Get user by username and verify password"""
+    # No account can have a username of this length, so skip the lookup. Accounts created
+    # before _valid_username() was enforced may use other characters, so only length is checked
+    if not 3 <= len(username) <= USERNAME_MAX_LENGTH:
+        check_password_hash(_DUMMY_HASH, password)
+        return None
+    
+    # A recent successful login with the same password skips the deliberately slow hash check
+    password_mac = hmac.new(_credential_key, password.encode(), hashlib.sha256).digest()
+    cached = login_cache.get(username)
+    if cached and hmac.compare_digest(cached[0], password_mac):
+        return dict(cached[1])
+    if failed_login_cache.get((username, password_mac)):
+        # Deliberate timing trade-off: a replayed rejection skips the slow hash, revealing only that
+        # this exact pair failed in the last five minutes, so repeated guesses don't each cost a hash
+        hmac.compare_digest(_DUMMY_MAC, password_mac)
+        return None
+    
+    user = _check_credentials(username, password)
+    if user:
+        login_cache.set(username, (password_mac, dict(user)))
+    else:
+        failed_login_cache.set((username, password_mac), True)
+    return user
+
+def _check_credentials(username, password):
+    """Look the user up in the database and verify the password against the stored hash"""
     if use_supabase:
         user = db.get_user_by_username(username)
-        if user and check_password_hash(user.get('password_hash', ''), password):
+        if not user:
+            check_password_hash(_DUMMY_HASH, password)
+            return None
+        if check_password_hash(user.get('password_hash', ''), password):
             return {
                 'id': user['id'],
                 'username': user['username'],
@@ -84,14 +220,13 @@ def get_user_by_credentials(username, password):
         return None
     else:
         # SQLite fallback
-        conn = sqlite3.connect(db.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT id, username, email, password_hash FROM users WHERE username = ?', (username,))
-        user = cursor.fetchone()
-        conn.close()
+        with pool.read() as conn:
+            user = conn.execute(_Q_USER_BY_USERNAME, (username,)).fetchone()
         
-        if user and check_password_hash(user[3], password):
+        if not user:
+            check_password_hash(_DUMMY_HASH, password)
+            return None
+        if check_password_hash(user[3], password):
             return {
                 'id': user[0],
                 'username': user[1],
@@ -102,18 +237,13 @@ def get_user_by_credentials(username, password):
 def update_user_table_for_auth():
     """Add password_hash column to users table if it doesn't exist (SQLite only)"""
     if not use_supabase:
-        conn = sqlite3.connect(db.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('ALTER TABLE users ADD COLUMN password_hash TEXT')
-            conn.commit()
+            with pool.write() as conn:
+                conn.execute('ALTER TABLE users ADD COLUMN password_hash TEXT')
             logger.info("Added password_hash column to users table")
         except sqlite3.OperationalError:
             # Column already exists
             pass
-        finally:
-            conn.close()
 
 # Initialize auth table updates (only for SQLite)
 if not use_supabase:
@@ -128,7 +258,7 @@ def health_check():
         total_articles = db.get_total_articles() if use_supabase else db.get_article_count()
         return jsonify({
             'status': 'healthy',
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.now(),
             'database': 'supabase' if use_supabase else 'sqlite',
             'total_articles': total_articles
         })
@@ -136,7 +266,7 @@ def health_check():
         logger.error(f"Health check failed: {e}")
         return jsonify({
             'status': 'unhealthy',
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.now(),
             'error': str(e)
         }), 500
 
@@ -156,6 +286,9 @@ def register():
         if len(username) < 3:
             return jsonify({'error': 'Username must be at least 3 characters long'}), 400
         
+        if not _valid_username(username):
+            return jsonify({'error': f'Username must be at most {USERNAME_MAX_LENGTH} characters and use only letters, digits, "_", "-" or "."'}), 400
+        
         if len(password) < 6:
             return jsonify({'error': 'Password must be at least 6 characters long'}), 400
         
@@ -169,29 +302,20 @@ def register():
                 return jsonify({'error': 'Username already exists'}), 409
         
         # Hash password and create user
-        password_hash = generate_password_hash(password)
+        password_hash = generate_password_hash(password, method=app.config['PASSWORD_HASH_METHOD'])
         
         if use_supabase:
             user_id = db.create_user(username, email, password_hash)
         else:
-            conn = sqlite3.connect(db.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO users (username, email, password_hash)
-                VALUES (?, ?, ?)
-            ''', (username, email, password_hash))
-            
-            user_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            with pool.write() as conn:
+                cursor = conn.execute(_Q_INSERT_USER, (username, email, password_hash))
+                user_id = cursor.lastrowid
+        
+        # Attempts made before the account existed must not keep failing
+        failed_login_cache.delete((username, hmac.new(_credential_key, password.encode(), hashlib.sha256).digest()))
         
         # Generate JWT token
-        token = jwt.encode({
-            'user_id': user_id,
-            'username': username,
-            'exp': datetime.utcnow() + app.config['JWT_EXPIRATION_DELTA']
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+        token = encode_token(user_id, username)
         
         return jsonify({
             'message': 'User created successfully',
@@ -225,11 +349,7 @@ def login():
             return jsonify({'error': 'Invalid username or password'}), 401
         
         # Generate JWT token
-        token = jwt.encode({
-            'user_id': user['id'],
-            'username': user['username'],
-            'exp': datetime.utcnow() + app.config['JWT_EXPIRATION_DELTA']
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+        token = encode_token(user['id'], user['username'])
         
         return jsonify({
             'message': 'Login successful',
@@ -251,17 +371,10 @@ def get_recommended_articles(current_user_id, current_username):
         
         scored_articles = db.get_personalized_articles(current_username, limit)
         
-        articles_data = []
-        for article, score in scored_articles:
-            articles_data.append({
-                'title': article.title,
-                'url': article.url,
-                'description': article.description,
-                'published_date': article.published_date.isoformat() if article.published_date else None,
-                'source': article.source,
-                'category': article.category,
-                'relevance_score': round(score, 3)
-            })
+        articles_data = [
+            dict(zip(_SCORED_ARTICLE_FIELDS, _article_fields(article) + (round(score, 3),)))
+            for article, score in scored_articles
+        ]
         
         return jsonify({
             'articles': articles_data,
@@ -276,42 +389,40 @@ def get_recommended_articles(current_user_id, current_username):
 @app.route('/api/articles/read', methods=['POST'])
 @token_required
 def mark_article_read(current_user_id, current_username):
-    """Mark an article as read by the current user"""
+    """Mark an article (or, with article_urls, several articles) as read by the current user"""
     try:
         data = request.get_json()
         
-        if not data or not data.get('article_url'):
+        if not data or not (data.get('article_url') or data.get('article_urls')):
             return jsonify({'error': 'article_url is required'}), 400
         
-        article_url = data['article_url']
+        # A single article_url keeps the original request and response shape
+        single = not data.get('article_urls')
+        article_urls = [data['article_url']] if single else data['article_urls']
+        if not isinstance(article_urls, list) or not all(isinstance(url, str) for url in article_urls):
+            return jsonify({'error': 'article_urls must be a list of URLs'}), 400
         action = data.get('action', 'read')  # 'read', 'clicked', 'dismissed'
         
-        # Find article by URL
-        if use_supabase:
-            # For Supabase, query the articles table
-            result = db.supabase.table('articles').select('id').eq('url', article_url).execute()
-            if not result.data:
-                return jsonify({'error': 'Article not found'}), 404
-            article_id = result.data[0]['id']
-        else:
-            # For SQLite, use direct connection
-            conn = sqlite3.connect(db.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT id FROM articles WHERE url = ?', (article_url,))
-            article = cursor.fetchone()
-            conn.close()
-            
-            if not article:
-                return jsonify({'error': 'Article not found'}), 404
-            article_id = article[0]
+        # Find all articles by URL in one query
+        article_ids = db.get_article_ids_by_url(article_urls)
+        if not article_ids:
+            return jsonify({'error': 'Article not found'}), 404
         
         # Add to reading history
-        db.add_reading_history(current_username, article_id, action)
+        found = [url for url in dict.fromkeys(article_urls) if url in article_ids]
+        db.add_reading_history_batch(current_username, [article_ids[url] for url in found], action)
+        
+        if single:
+            return jsonify({
+                'message': f'Article marked as {action}',
+                'article_url': article_urls[0],
+                'action': action
+            }), 200
         
         return jsonify({
-            'message': f'Article marked as {action}',
-            'article_url': article_url,
+            'message': f'{len(found)} articles marked as {action}',
+            'article_urls': found,
+            'not_found': [url for url in dict.fromkeys(article_urls) if url not in article_ids],
             'action': action
         }), 200
         
@@ -382,57 +493,46 @@ def update_user_preference(current_user_id, current_username, preference_id):
             return jsonify({'error': 'Request body is required'}), 400
         
         if use_supabase:
-            # For Supabase, use the database method
+            # For Supabase; the token's user_id is the Supabase user id, so no user lookup is needed
             description = data.get('description')
             weight = data.get('weight')
             
-            # Check if preference belongs to current user
-            user = db.get_user_by_username(current_username)
-            if not user:
-                return jsonify({'error': 'User not found'}), 404
-            
-            # Get existing preference to check ownership
-            pref_result = db.supabase.table('user_preferences').select('*').eq('id', preference_id).eq('user_id', user['id']).execute()
-            if not pref_result.data:
-                return jsonify({'error': 'Preference not found or access denied'}), 404
-            
-            existing_pref = pref_result.data[0]
-            
-            # Use existing values if not provided
-            if description is None:
-                description = existing_pref['description']
-            else:
+            if description is not None:
                 description = description.strip()
                 if not description:
                     return jsonify({'error': 'description cannot be empty'}), 400
             
-            if weight is None:
-                weight = existing_pref['weight']
-            
-            # Generate new embedding and update
-            embedding = db.embedding_service.create_preference_embedding(description)
-            
-            update_data = {
-                'description': description,
-                'weight': weight,
-                'embedding': db.embedding_service.serialize_embedding(embedding)
-            }
-            
-            db.supabase.table('user_preferences').update(update_data).eq('id', preference_id).execute()
+            existing_pref = None
+            if description is None or weight is None:
+                # Get existing preference (and check ownership) to fill in the missing values
+                pref_result = db.supabase.table('user_preferences').select('description, weight').eq('id', preference_id).eq('user_id', current_user_id).execute()
+                if not pref_result.data:
+                    return jsonify({'error': 'Preference not found or access denied'}), 404
+                
+                existing_pref = pref_result.data[0]
+                if description is None:
+                    description = existing_pref['description']
+                if weight is None:
+                    weight = existing_pref['weight']
+            
+            update_data = {'weight': weight}
+            if existing_pref is None or description != existing_pref['description']:
+                # Only a changed description needs a new embedding
+                embedding = db.embedding_service.create_preference_embedding(description)
+                update_data['description'] = description
+                update_data['embedding'] = pgvector_literal(embedding.tolist())  # pgvector text input, not a serialized blob
+            
+            # Filtering on user_id makes the update its own ownership check
+            result = db.supabase.table('user_preferences').update(update_data).eq('id', preference_id).eq('user_id', current_user_id).execute()
+            if not result.data:
+                return jsonify({'error': 'Preference not found or access denied'}), 404
             
         else:
-            # For SQLite, use direct connection
-            conn = sqlite3.connect(db.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT id, description, weight FROM user_preferences 
-                WHERE id = ? AND user_id = ?
-            ''', (preference_id, current_user_id))
+            # For SQLite, use pooled connections
+            with pool.read() as conn:
+                existing_pref = conn.execute(_Q_SELECT_PREF_BY_ID, (preference_id, current_user_id)).fetchone()
             
-            existing_pref = cursor.fetchone()
             if not existing_pref:
-                conn.close()
                 return jsonify({'error': 'Preference not found or access denied'}), 404
             
             # Get updated values or keep existing ones
@@ -445,27 +545,25 @@ def update_user_preference(current_user_id, current_username, preference_id):
             else:
                 description = description.strip()
                 if not description:
-                    conn.close()
                     return jsonify({'error': 'description cannot be empty'}), 400
             
-            # Generate new embedding
-            embedding = db.embedding_service.create_preference_embedding(description)
-            
-            # Update preference
-            cursor.execute('''
-                UPDATE user_preferences 
-                SET description = ?, weight = ?, embedding = ?
-                WHERE id = ? AND user_id = ?
-            ''', (
-                description,
-                weight,
-                db.embedding_service.serialize_embedding(embedding),
-                preference_id,
-                current_user_id
-            ))
-            
-            conn.commit()
-            conn.close()
+            if description == existing_pref[1]:
+                # Same text, so the stored embedding is still right; only the weight can change
+                with pool.write() as conn:
+                    conn.execute(_Q_UPDATE_PREF_WEIGHT, (weight, preference_id, current_user_id))
+            else:
+                # Generate new embedding (outside the write lock, it is the slow part)
+                embedding = db.embedding_service.create_preference_embedding(description)
+                
+                # Update preference
+                with pool.write() as conn:
+                    conn.execute(_Q_UPDATE_PREF, (
+                        description,
+                        weight,
+                        db.embedding_service.serialize_embedding(embedding),
+                        preference_id,
+                        current_user_id
+                    ))
         
         return jsonify({
             'message': 'Preference updated successfully',
@@ -501,30 +599,17 @@ def delete_user_preference(current_user_id, current_username, preference_id):
             
         else:
             # For SQLite
-            conn = sqlite3.connect(db.db_path)
-            cursor = conn.cursor()
-            
-            # Check if preference exists and belongs to current user
-            cursor.execute('''
-                SELECT description FROM user_preferences 
-                WHERE id = ? AND user_id = ?
-            ''', (preference_id, current_user_id))
-            
-            existing_pref = cursor.fetchone()
-            if not existing_pref:
-                conn.close()
-                return jsonify({'error': 'Preference not found or access denied'}), 404
-            
-            deleted_description = existing_pref[0]
-            
-            # Delete the preference
-            cursor.execute('''
-                DELETE FROM user_preferences 
-                WHERE id = ? AND user_id = ?
-            ''', (preference_id, current_user_id))
-            
-            conn.commit()
-            conn.close()
+            with pool.write() as conn:
+                # Check if preference exists and belongs to current user
+                existing_pref = conn.execute(_Q_SELECT_PREF_DESCRIPTION, (preference_id, current_user_id)).fetchone()
+                
+                if not existing_pref:
+                    return jsonify({'error': 'Preference not found or access denied'}), 404
+                
+                deleted_description = existing_pref[0]
+                
+                # Delete the preference
+                conn.execute(_Q_DELETE_PREF, (preference_id, current_user_id))
         
         return jsonify({
             'message': 'Preference deleted successfully',
@@ -542,38 +627,17 @@ def clear_all_user_preferences(current_user_id, current_username):
     """Clear all preferences for the current user"""
     try:
         if use_supabase:
-            # For Supabase
-            user = db.get_user_by_username(current_username)
-            if not user:
-                return jsonify({'error': 'User not found'}), 404
-            
-            # Count existing preferences
-            count_result = db.supabase.table('user_preferences').select('id', count='exact').eq('user_id', user['id']).execute()
-            count = count_result.count
-            
-            if count == 0:
-                return jsonify({'message': 'No preferences to clear'}), 200
-            
-            # Delete all preferences for user
-            db.supabase.table('user_preferences').delete().eq('user_id', user['id']).execute()
+            # For Supabase: the delete reports how many rows it removed, without returning them
+            result = db.supabase.table('user_preferences').delete(count='exact', returning='minimal').eq('user_id', current_user_id).execute()
+            count = result.count
             
         else:
-            # For SQLite
-            conn = sqlite3.connect(db.db_path)
-            cursor = conn.cursor()
-            
-            # Count existing preferences
-            cursor.execute('SELECT COUNT(*) FROM user_preferences WHERE user_id = ?', (current_user_id,))
-            count = cursor.fetchone()[0]
-            
-            if count == 0:
-                conn.close()
-                return jsonify({'message': 'No preferences to clear'}), 200
-            
-            # Delete all preferences for user
-            cursor.execute('DELETE FROM user_preferences WHERE user_id = ?', (current_user_id,))
-            conn.commit()
-            conn.close()
+            # For SQLite: DELETE's rowcount replaces a separate COUNT(*)
+            with pool.write() as conn:
+                count = conn.execute(_Q_CLEAR_PREFS, (current_user_id,)).rowcount
+        
+        if count == 0:
+            return jsonify({'message': 'No preferences to clear'}), 200
         
         return jsonify({
             'message': f'All {count} preferences cleared successfully',
@@ -591,6 +655,7 @@ def delete_user_account(current_user_id, current_username):
     try:
         # Delete user and all related data
         success = db.delete_user(current_username, confirm=True)
+        login_cache.delete(current_username)
         
         if success:
             return jsonify({
@@ -612,23 +677,28 @@ def get_latest_articles(current_user_id, current_username):
         limit = request.args.get('limit', 20, type=int)
         limit = min(limit, 100)  # Cap at 100 articles
         
-        articles = db.get_latest_articles(limit)
-        
-        articles_data = []
-        for article in articles:
-            articles_data.append({
-                'title': article.title,
-                'url': article.url,
-                'description': article.description,
-                'published_date': article.published_date.isoformat() if article.published_date else None,
-                'source': article.source,
-                'category': article.category
-            })
-        
-        return jsonify({
-            'articles': articles_data,
-            'total': len(articles_data)
-        }), 200
+        # Run the query and read the first row here, so database errors still take the 500 path below
+        articles = db.iter_latest_articles(limit)
+        first = next(articles, None)
+        if first is not None:
+            articles = itertools.chain((first,), articles)
+        
+        def generate():
+            # Write each article as the database yields it; nothing holds the whole body, so the
+            # response is not cached (a cached copy would need exactly the memory this avoids)
+            yield b'{"articles":['
+            total = 0
+            try:
+                for total, article in enumerate(articles, 1):
+                    yield (b',' if total > 1 else b'') + orjson.dumps(dict(zip(_ARTICLE_FIELDS, _article_fields(article))))
+            except Exception as e:
+                # The 200 status is already sent; re-raising aborts the response so the client
+                # gets a broken stream instead of a well-formed, truncated article list
+                logger.error(f"Error streaming latest articles: {e}")
+                raise
+            yield b'],"total":%d}' % total
+        
+        return app.response_class(stream_with_context(generate()), mimetype='application/json'), 200
         
     except Exception as e:
         logger.error(f"Error getting latest articles: {e}")
@@ -639,6 +709,24 @@ def get_latest_articles(current_user_id, current_username):
 def trigger_scrape(current_user_id, current_username):
     """Trigger a news scrape (admin functionality)"""
     try:
+        if scheduler_instance is not None and scheduler_instance.is_running:
+            # Hand the scrape to the background scheduler instead of holding this worker;
+            # max_instances=1 drops triggers that arrive while a manual scrape is running
+            scheduler_instance.scheduler.add_job(
+                scraper.scrape_all_feeds,
+                id='manual_scrape',
+                name='Manual News Scrape',
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True,
+                misfire_grace_time=60
+            )
+            return jsonify({
+                'status': 'queued',
+                'message': 'Scrape queued; poll /api/scheduler/status for progress'
+            }), 202
+        
+        # No background scheduler running: scrape within the request
         results = scraper.scrape_all_feeds()
         
         total_new = sum(results.values())
@@ -654,62 +742,47 @@ def trigger_scrape(current_user_id, current_username):
         logger.error(f"Error during scrape: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def _supabase_reading_history_rows(user_id, limit):
+    """Flatten reading history rows with their embedded article, as the get_reading_history RPC returns them"""
+    result = db.supabase.table('reading_history').select('''
+        action, timestamp,
+        articles (
+            title, url, source
+        )
+    ''').eq('user_id', user_id).order('timestamp', desc=True).limit(limit).execute()
+    
+    return [{**row['articles'], 'action': row['action'], 'timestamp': row['timestamp']}
+            for row in result.data if row['articles']]
+
 @app.route('/api/user/reading-history', methods=['GET'])
 @token_required
 def get_reading_history(current_user_id, current_username):
     """Get reading history for the current user"""
     try:
         if use_supabase:
-            # For Supabase
-            user = db.get_user_by_username(current_username)
-            if not user:
-                return jsonify({'reading_history': [], 'total': 0}), 200
-            
-            # Get reading history with article details
-            result = db.supabase.table('reading_history').select('''
-                action, timestamp,
-                articles (
-                    title, url, source
-                )
-            ''').eq('user_id', user['id']).order('timestamp', desc=True).limit(100).execute()
-            
-            history = []
-            for row in result.data:
-                if row['articles']:
-                    article_data = row['articles']
-                    history.append({
-                        'title': article_data['title'],
-                        'url': article_data['url'],
-                        'source': article_data['source'],
-                        'action': row['action'],
-                        'timestamp': row['timestamp']
-                    })
+            # For Supabase: one round trip to the get_reading_history function
+            # (supabase/migrations/*_get_reading_history.sql), which does the join server-side
+            try:
+                rows = db.supabase.rpc('get_reading_history', {'uid': current_user_id, 'lim': 100}).execute().data
+            except Exception as e:
+                logger.warning(f"get_reading_history RPC unavailable, using embedded select: {e}")
+                rows = _supabase_reading_history_rows(current_user_id, 100)
+            
+            history = [{
+                'title': row['title'],
+                'url': row['url'],
+                'source': row['source'],
+                'action': row['action'],
+                'timestamp': row['timestamp']
+            } for row in rows]
             
         else:
-            # For SQLite
-            conn = sqlite3.connect(db.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT a.title, a.url, a.source, rh.action, rh.timestamp
-                FROM reading_history rh
-                JOIN articles a ON rh.article_id = a.id
-                WHERE rh.user_id = ?
-                ORDER BY rh.timestamp DESC
-                LIMIT 100
-            ''', (current_user_id,))
-            
-            history = []
-            for row in cursor.fetchall():
-                history.append({
-                    'title': row[0],
-                    'url': row[1],
-                    'source': row[2],
-                    'action': row[3],
-                    'timestamp': row[4]
-                })
+            # For SQLite: splice the JSON1-rendered rows into the body
+            with pool.read() as conn:
+                rows = conn.execute(_Q_READING_HISTORY_JSON, (current_user_id,)).fetchall()
             
-            conn.close()
+            body = '{"reading_history":[' + ','.join(row[0] for row in rows) + '],"total":' + str(len(rows)) + '}'
+            return app.response_class(body, mimetype='application/json'), 200
         
         return jsonify({
             'reading_history': history,
@@ -728,14 +801,7 @@ def get_scheduler_status(current_user_id, current_username):
         scheduler = get_scheduler()
         status = scheduler.get_scheduler_status()
         
-        # Convert datetime objects to strings for JSON serialization
-        if status['next_run_time']:
-            status['next_run_time'] = status['next_run_time'].isoformat()
-        
-        for job in status['jobs']:
-            if job['next_run_time']:
-                job['next_run_time'] = job['next_run_time'].isoformat()
-        
+        # next_run_time values stay datetimes; the orjson provider writes them as ISO 8601
         return jsonify({
             'scheduler_status': status,
             'message': 'Articles are automatically scraped every 2 hours' if status['is_running'] else 'Scheduler is not running'
@@ -759,5 +825,5 @@ def bad_request(error):
     return jsonify({'error': 'Bad request'}), 400
 
 if __name__ == '__main__':
-    # Run the Flask development server
-    app.run(debug=True, host='0.0.0.0', port=5002)
\ No newline at end of file
+    # Run the Flask development server; use wsgi.py with gunicorn in production
+    app.run(debug=os.getenv('FLASK_DEBUG', '1') == '1', host='0.0.0.0', port=5002, threaded=True)
\ No newline at end of file
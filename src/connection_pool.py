@@ -0,0 +1,48 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+
+class ConnectionPool:
+    """A fixed set of long-lived SQLite connections: several readers and one serialized writer"""
+    
+    def __init__(self, connect: Callable[[], sqlite3.Connection], size: int = 4):
+        """Open `size` read connections and one write connection with the given factory"""
+        self._readers = queue.Queue()
+        for _ in range(size):
+            conn = connect()
+            # Readers never write; WAL lets them run alongside the writer
+            conn.execute("PRAGMA query_only=ON")
+            self._readers.put(conn)
+        
+        self._writer = connect()
+        self._write_lock = threading.Lock()
+    
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a read-only connection, waiting if all of them are in use"""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+    
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """Hold the write connection; commit on success, roll back if the block raises"""
+        with self._write_lock:
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+    
+    def close(self):
+        """Close every connection in the pool"""
+        with self._write_lock:
+            self._writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
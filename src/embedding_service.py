@@ -1,58 +1,215 @@
+import io
+import math
+import os
 import numpy as np
 import pickle
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from ttl_cache import TTLCache
 from typing import List, Tuple, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Globals a pickled float32 ndarray refers to (numpy 1.x and 2.x module paths)
+_LEGACY_PICKLE_GLOBALS = {
+    ('numpy', 'ndarray'), ('numpy', 'dtype'), ('_codecs', 'encode'),
+    ('numpy.core.multiarray', '_reconstruct'), ('numpy._core.multiarray', '_reconstruct'),
+    ('numpy.core.numeric', '_frombuffer'), ('numpy._core.numeric', '_frombuffer'),
+}
+
+class _LegacyEmbeddingUnpickler(pickle.Unpickler):
+    """Unpickler for legacy embedding blobs that refuses anything but a plain NumPy array"""
+    
+    def find_class(self, module, name):
+        if (module, name) not in _LEGACY_PICKLE_GLOBALS:
+            raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from an embedding blob")
+        return super().find_class(module, name)
+
+def is_legacy_embedding(embedding_bytes: bytes, dim: int) -> bool:
+    """Whether a stored blob predates the raw int8 format, i.e. is a pickle (starts with the PROTO opcode)"""
+    # A raw record's scale may also start with 0x80, but then it has the raw record size
+    return embedding_bytes[:1] == b'\x80' and len(embedding_bytes) != 4 + dim
+
 class EmbeddingService:
-    def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
-        """Initialize embedding service with a pre-trained model"""
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', backend: Optional[str] = None):
+        """Initialize embedding service with a pre-trained model.
+        
+        backend defaults to EMBEDDING_BACKEND: 'torch', or 'onnx' to run the model in ONNX Runtime
+        (much faster on CPU; EMBEDDING_ONNX_FILE picks a quantized export such as
+        onnx/model_qint8_avx512_vnni.onnx). Falls back to torch if the ONNX model cannot be loaded.
+        
+        EMBEDDING_TRUNCATE_DIM keeps only the leading dimensions of every embedding (renormalized),
+        trading some ranking quality for proportionally cheaper scoring and storage. Stored vectors
+        must all have the same size, so set it only on a new database (NewsDatabase refuses to open
+        one whose vectors have a different size).
+        """
+        self.model_name = model_name
+        self.backend = backend or os.getenv('EMBEDDING_BACKEND', 'torch')
+        self.truncate_dim = int(os.getenv('EMBEDDING_TRUNCATE_DIM', '0')) or None
+        self.model = self._load_model(model_name)
+        if self.backend == 'torch':
+            self._configure_torch_threads()
         self.embedding_dim = self.model.get_sentence_embedding_dimension()
-        logger.info(f"Loaded embedding model: {model_name} (dim: {self.embedding_dim})")
+        # Preference descriptions repeat (re-adding, edits back to old text, migrations); the cache
+        # belongs to this model instance, so a different model never sees these vectors
+        self._preference_cache = TTLCache(maxsize=4096, ttl=math.inf)
+        logger.info(f"Loaded embedding model: {model_name} (dim: {self.embedding_dim}, backend: {self.backend})")
     
-    def create_article_embedding(self, title: str, description: str, category: str = None) -> np.ndarray:
-        """Create embedding vector for an article"""
-        # Combine title, description, and category for richer representation
+    def _load_model(self, model_name: str) -> SentenceTransformer:
+        """Load the model on self.backend, switching it to torch if that backend is unavailable"""
+        if self.backend == 'torch':
+            return SentenceTransformer(model_name, truncate_dim=self.truncate_dim)
+        
+        onnx_file = os.getenv('EMBEDDING_ONNX_FILE')
+        try:
+            # Needs sentence-transformers >= 3.2 and optimum[onnxruntime]
+            return SentenceTransformer(model_name, backend=self.backend, truncate_dim=self.truncate_dim,
+                                       model_kwargs={'file_name': onnx_file} if onnx_file else None)
+        except (ImportError, TypeError, ValueError, OSError) as e:
+            logger.warning(f"Could not load {model_name} with the {self.backend} backend ({e}), using torch")
+            self.backend = 'torch'
+            return SentenceTransformer(model_name, truncate_dim=self.truncate_dim)
+    
+    @staticmethod
+    def _configure_torch_threads():
+        """Size torch's intra-op pool to the CPUs this process may actually use (EMBEDDING_THREADS overrides);
+        torch otherwise sizes it from the host's cores, which oversubscribes CPU-limited containers"""
+        import torch
+        
+        threads = int(os.getenv('EMBEDDING_THREADS', '0'))
+        if threads <= 0:
+            threads = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 4)
+        torch.set_num_threads(threads)
+        try:
+            # encode() runs one model at a time, so inter-op parallelism only adds thread contention
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Already fixed once torch has run parallel work in this process
+            pass
+    
+    def _article_text(self, title: str, description: str, category: str = None) -> str:
+        """Combine title, description, and category for richer representation"""
         text_parts = [title, description]
         if category:
             text_parts.append(f"Category: {category}")
         
-        combined_text = " ".join(filter(None, text_parts))
-        
-        # Generate embedding
-        embedding = self.model.encode(combined_text, normalize_embeddings=True)
+        return " ".join(filter(None, text_parts))
+    
+    def create_article_embedding(self, title: str, description: str, category: str = None) -> np.ndarray:
+        """Create embedding vector for an article"""
+        embedding = self.model.encode(self._article_text(title, description, category), normalize_embeddings=True)
         return embedding
     
+    def create_article_embedding_batch(self, titles: List[str], descriptions: List[str],
+                                       categories: List[Optional[str]], batch_size: int = 64) -> np.ndarray:
+        """Create embedding vectors for many articles with one batched model call, one row per article"""
+        texts = [self._article_text(t, d, c) for t, d, c in zip(titles, descriptions, categories)]
+        if not texts:
+            return np.empty((0, self.embedding_dim), dtype=np.float32)
+        return self.model.encode(texts, batch_size=batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True, show_progress_bar=False)
+    
     def create_preference_embedding(self, description: str) -> np.ndarray:
         """Create embedding vector for user preference description"""
-        embedding = self.model.encode(description, normalize_embeddings=True)
-        return embedding
+        return self.create_preference_embedding_batch([description])[0]
+    
+    def create_preference_embedding_batch(self, descriptions: List[str], batch_size: int = 64) -> np.ndarray:
+        """Create embedding vectors for many preference descriptions, encoding only those not seen
+        recently in one batched model call"""
+        embeddings = np.empty((len(descriptions), self.embedding_dim), dtype=np.float32)
+        missing = {}
+        for i, description in enumerate(descriptions):
+            cached = self._preference_cache.get(description)
+            if cached is None:
+                missing.setdefault(description, []).append(i)
+            else:
+                embeddings[i] = cached
+        
+        if missing:
+            encoded = self.model.encode(list(missing), batch_size=batch_size, normalize_embeddings=True,
+                                        convert_to_numpy=True, show_progress_bar=False)
+            for (description, rows), embedding in zip(missing.items(), encoded):
+                embedding = np.asarray(embedding, dtype=np.float32)
+                embedding.flags.writeable = False
+                self._preference_cache.set(description, embedding)
+                embeddings[rows] = embedding
+        return embeddings
     
     def calculate_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """Calculate cosine similarity between two embeddings"""
-        return cosine_similarity([embedding1], [embedding2])[0][0]
+        a = np.asarray(embedding1, dtype=np.float32)
+        b = np.asarray(embedding2, dtype=np.float32)
+        # One sqrt over two dot products is cheaper than two np.linalg.norm calls
+        denominator = float(np.sqrt(np.vdot(a, a) * np.vdot(b, b)))
+        return float(np.dot(a, b)) / denominator if denominator else 0.0
+    
+    def weighted_similarity_scores(self, article_embeddings: np.ndarray,
+                                   preference_embeddings: np.ndarray,
+                                   weights: np.ndarray,
+                                   articles_normalized: bool = False) -> np.ndarray:
+        """Score each article row by the weighted sum of its cosine similarity to each preference row"""
+        articles = np.asarray(article_embeddings, dtype=np.float32)
+        if not articles_normalized:
+            articles = articles / np.maximum(np.linalg.norm(articles, axis=1, keepdims=True), 1e-12)
+        return articles @ self.preference_centroid(preference_embeddings, weights)
+    
+    def preference_centroid(self, preference_embeddings: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Fold weighted preference rows into one query vector c, so that a_hat . c is the weighted
+        sum of cosine similarities between a unit article vector and every preference"""
+        preferences = np.asarray(preference_embeddings, dtype=np.float32)
+        preferences = preferences / np.maximum(np.linalg.norm(preferences, axis=1, keepdims=True), 1e-12)
+        
+        # sum_p w_p * cos(a, p) == a_hat . (sum_p w_p * p_hat)
+        return preferences.T @ np.asarray(weights, dtype=np.float32)
     
     def find_similar_articles(self, preference_embedding: np.ndarray, 
                             article_embeddings: List[np.ndarray], 
-                            threshold: float = 0.5) -> List[Tuple[int, float]]:
-        """Find articles similar to user preferences"""
-        similarities = []
-        for i, article_embedding in enumerate(article_embeddings):
-            similarity = self.calculate_similarity(preference_embedding, article_embedding)
-            if similarity >= threshold:
-                similarities.append((i, similarity))
+                            threshold: float = 0.5,
+                            articles_normalized: bool = False,
+                            top_k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Find articles similar to user preferences; pass an (N, D) matrix to skip re-stacking a list"""
+        if len(article_embeddings) == 0:
+            return []
+        
+        scores = self.weighted_similarity_scores(article_embeddings, np.asarray(preference_embedding)[None, :],
+                                                 np.ones(1, dtype=np.float32), articles_normalized)
+        matches = np.flatnonzero(scores >= threshold)
+        if top_k is not None and top_k < len(matches):
+            # Keep the top_k matches without sorting all of them
+            matches = np.sort(matches[np.argpartition(-scores[matches], top_k - 1)[:top_k]])
         
         # Sort by similarity (highest first)
-        return sorted(similarities, key=lambda x: x[1], reverse=True)
+        order = matches[np.argsort(-scores[matches], kind='stable')]
+        return list(zip(order.tolist(), scores[order].tolist()))
     
     def serialize_embedding(self, embedding: np.ndarray) -> bytes:
-        """Serialize embedding for database storage"""
-        return pickle.dumps(embedding)
+        """Serialize embedding for database storage as a float32 scale followed by int8 components"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        scale = float(np.max(np.abs(vector))) / 127.0 or 1.0
+        quantized = np.round(vector / scale).astype(np.int8)
+        return np.float32(scale).tobytes() + quantized.tobytes()
     
     def deserialize_embedding(self, embedding_bytes: bytes) -> np.ndarray:
         """Deserialize embedding from database"""
-        return pickle.loads(embedding_bytes)
\ No newline at end of file
+        if is_legacy_embedding(embedding_bytes, self.embedding_dim):
+            # Legacy pickled float32 vector; NewsDatabase.maintenance() rewrites these
+            return np.asarray(_LegacyEmbeddingUnpickler(io.BytesIO(embedding_bytes)).load(), dtype=np.float32)
+        
+        if len(embedding_bytes) != 4 + self.embedding_dim:
+            raise ValueError(f"Stored embedding has {len(embedding_bytes) - 4} dimensions, "
+                             f"the model produces {self.embedding_dim}")
+        
+        scale = np.frombuffer(embedding_bytes, dtype=np.float32, count=1)[0]
+        quantized = np.frombuffer(embedding_bytes, dtype=np.int8, offset=4)
+        return quantized.astype(np.float32) * scale
+    
+    def deserialize_embedding_batch(self, blobs: List[bytes]) -> np.ndarray:
+        """Deserialize many embeddings into one (n, dim) float32 matrix with a single frombuffer"""
+        record_size = 4 + self.embedding_dim
+        if any(len(blob) != record_size for blob in blobs):
+            # Mixed with legacy pickles, decode row by row
+            return np.array([self.deserialize_embedding(blob) for blob in blobs],
+                            dtype=np.float32).reshape(len(blobs), self.embedding_dim)
+        
+        records = np.frombuffer(b''.join(blobs), dtype=[('scale', '<f4'), ('quantized', 'i1', self.embedding_dim)])
+        return records['quantized'] * records['scale'][:, None]
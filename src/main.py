@@ -6,7 +6,7 @@ A simple news aggregator that scrapes RSS feeds and stores articles in a databas
 
 import sys
 import argparse
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 # from news_database import NewsDatabase, NewsArticle
 from supabase_database import SupabaseDatabase
 from news_scraper import NewsScraper
@@ -41,6 +41,9 @@ class NewsTracker:
         print("-" * 30)
         print(f"{'Total':20}: {total_new:3} new articles")
         print(f"Database now contains {self.db.get_article_count()} articles total")
+        
+        # Refresh query planner statistics after the bulk insert
+        self.db.analyze()
     
     def show_latest(self, limit=10):
         """Display the latest articles"""
@@ -53,14 +56,17 @@ class NewsTracker:
         print(f"\n📰 Latest {len(articles)} Articles:")
         print("=" * 80)
         
+        # Build the listing and write it once instead of a print() per line
+        lines = []
         for i, article in enumerate(articles, 1):
-            print(f"\n{i}. {article.title}")
-            print(f"   📅 {article.published_date.strftime('%Y-%m-%d %H:%M') if article.published_date else 'No date'}")
-            print(f"   📊 {article.source}")
+            lines.append(f"\n{i}. {article.title}")
+            lines.append(f"   📅 {article.published_date.strftime('%Y-%m-%d %H:%M') if article.published_date else 'No date'}")
+            lines.append(f"   📊 {article.source}")
             if article.category:
-                print(f"   🏷️  {article.category}")
-            print(f"   🔗 {article.url}")
-            print(f"   📝 {article.description[:150]}{'...' if len(article.description) > 150 else ''}")
+                lines.append(f"   🏷️  {article.category}")
+            lines.append(f"   🔗 {article.url}")
+            lines.append(f"   📝 {article.description[:150]}{'...' if len(article.description) > 150 else ''}")
+        sys.stdout.write("\n".join(lines) + "\n")
     
     def search_articles(self, keyword, limit=10):
         """Search for articles containing a keyword"""
@@ -73,41 +79,38 @@ class NewsTracker:
         print(f"\n🔍 Search Results for '{keyword}' ({len(articles)} found):")
         print("=" * 80)
         
+        lines = []
         for i, article in enumerate(articles, 1):
-            print(f"\n{i}. {article.title}")
-            print(f"   📅 {article.published_date.strftime('%Y-%m-%d %H:%M') if article.published_date else 'No date'}")
-            print(f"   📊 {article.source}")
-            print(f"   🔗 {article.url}")
+            lines.append(f"\n{i}. {article.title}")
+            lines.append(f"   📅 {article.published_date.strftime('%Y-%m-%d %H:%M') if article.published_date else 'No date'}")
+            lines.append(f"   📊 {article.source}")
+            lines.append(f"   🔗 {article.url}")
+        sys.stdout.write("\n".join(lines) + "\n")
     
     def show_stats(self):
         """Display database statistics"""
-        total_articles = self.db.get_article_count()
+        # Totals, last 24 hours and top sources, aggregated by the database
+        yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+        total_articles, recent_count, top_sources = self.db.get_stats(yesterday, 5)
         
         print("\n📈 Database Statistics:")
         print("-" * 30)
         print(f"Total articles: {total_articles}")
         
         if total_articles > 0:
-            # Get articles from last 24 hours
-            recent_articles = self.db.get_latest_articles(1000)  # Get more to filter by date
-            today = datetime.now()
-            yesterday = today - timedelta(days=1)
-            
-            recent_count = sum(1 for a in recent_articles 
-                             if a.published_date and a.published_date > yesterday)
-            
             print(f"Articles from last 24h: {recent_count}")
             
             # Show sources
-            sources = {}
-            for article in recent_articles[:100]:  # Sample recent articles
-                source = article.source
-                sources[source] = sources.get(source, 0) + 1
-            
             print("\nTop sources:")
-            for source, count in sorted(sources.items(), key=lambda x: x[1], reverse=True)[:5]:
+            for source, count in top_sources:
                 print(f"  {source}: {count}")
     
+    def maintenance(self):
+        """Compact the database and rebuild its indexes"""
+        print("🧹 Running database maintenance...")
+        self.db.maintenance()
+        print("✅ Maintenance complete")
+    
     def add_feed(self, name, url):
         """Add a custom RSS feed"""
         if self.scraper.test_feed(url):
@@ -128,19 +131,30 @@ class NewsTracker:
 
     def list_titles(self, limit=None):
         """List all articles by their titles"""
-        articles = self.db.get_latest_articles(limit or 1000)  # Get all or specified limit
+        # Stream rows so the first titles print before the rest are fetched
+        articles = self.db.iter_latest_articles(limit or 1000)  # Get all or specified limit
         
-        if not articles:
+        count = 0
+        lines = []
+        for count, article in enumerate(articles, 1):
+            if count == 1:
+                lines.append("\n📋 All Article Titles:")
+                lines.append("=" * 80)
+            published = article.published_date.strftime('%Y-%m-%d') if article.published_date else 'No date'
+            lines.append(f"{count:4}. [{published}] {article.title}")
+            lines.append(f"      Source: {article.source}")
+            if count % 64 == 0:
+                # Write in batches rather than a print() per line
+                sys.stdout.write("\n".join(lines) + "\n")
+                lines.clear()
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
+        
+        if count == 0:
             print("No articles found in database. Run scrape first!")
             return
         
-        print(f"\n📋 All Article Titles ({len(articles)} total):")
-        print("=" * 80)
-        
-        for i, article in enumerate(articles, 1):
-            published = article.published_date.strftime('%Y-%m-%d') if article.published_date else 'No date'
-            print(f"{i:4}. [{published}] {article.title}")
-            print(f"      Source: {article.source}")
+        print(f"\n{count} total")
     
     def show_personalized(self, username, limit=100):
         """Show personalized article recommendations for specific user"""
@@ -153,18 +167,21 @@ class NewsTracker:
         print(f"\n🎯 Personalized Recommendations for {username} ({len(scored_articles)} articles):")
         print("=" * 80)
         
+        lines = []
         for i, (article, score) in enumerate(scored_articles, 1):
-            print(f"\n{i}. {article.title} (Score: {score:.3f})")
-            print(f"   📅 {article.published_date.strftime('%Y-%m-%d %H:%M') if article.published_date else 'No date'}")
-            print(f"   📊 {article.source}")
+            lines.append(f"\n{i}. {article.title} (Score: {score:.3f})")
+            lines.append(f"   📅 {article.published_date.strftime('%Y-%m-%d %H:%M') if article.published_date else 'No date'}")
+            lines.append(f"   📊 {article.source}")
             if article.category:
-                print(f"   🏷️  {article.category}")
-            print(f"   🔗 {article.url}")
+                lines.append(f"   🏷️  {article.category}")
+            lines.append(f"   🔗 {article.url}")
+        sys.stdout.write("\n".join(lines) + "\n")
     
-    def add_preference(self, username, description, weight=1.0):
-        """Add user preference for personalization for specific user"""
-        self.db.add_user_preference_with_embedding(username, description, weight)
-        print(f"✅ Added preference for {username}: {description}")
+    def add_preference(self, username, descriptions, weight=1.0):
+        """Add user preferences for personalization for specific user, embedding them together"""
+        self.db.add_user_preferences_with_embeddings(username, [(description, weight) for description in descriptions])
+        for description in descriptions:
+            print(f"✅ Added preference for {username}: {description}")
         print(f"   Weight: {weight}")
     
     def list_users(self):
@@ -213,25 +230,27 @@ class NewsTracker:
         print(f"\n📚 Reading History for {username} ({len(history)} articles):")
         print("=" * 80)
         
+        lines = []
         for i, (article, read_date) in enumerate(history, 1):
-            print(f"\n{i}. {article.title}")
-            print(f"   📅 Read on: {read_date.strftime('%Y-%m-%d %H:%M')}")
-            print(f"   📊 Source: {article.source}")
+            lines.append(f"\n{i}. {article.title}")
+            lines.append(f"   📅 Read on: {read_date.strftime('%Y-%m-%d %H:%M')}")
+            lines.append(f"   📊 Source: {article.source}")
             if article.category:
-                print(f"   🏷️  Category: {article.category}")
-            print(f"   🔗 {article.url}")
-            print(f"   📝 {article.description[:100]}{'...' if len(article.description) > 100 else ''}")
+                lines.append(f"   🏷️  Category: {article.category}")
+            lines.append(f"   🔗 {article.url}")
+            lines.append(f"   📝 {article.description[:100]}{'...' if len(article.description) > 100 else ''}")
+        sys.stdout.write("\n".join(lines) + "\n")
 
 def main():
     parser = argparse.ArgumentParser(description='News Tracker MVP')
-    parser.add_argument('command', choices=['scrape', 'latest', 'search', 'stats', 'add-feed', 'list-feeds', 'list-titles', 'personalized', 'add-preference', 'list-users', 'user-preferences', 'delete-user', 'reading-history'],
+    parser.add_argument('command', choices=['scrape', 'latest', 'search', 'stats', 'add-feed', 'list-feeds', 'list-titles', 'personalized', 'add-preference', 'list-users', 'user-preferences', 'delete-user', 'reading-history', 'maintenance'],
                        help='Command to execute')
     parser.add_argument('--keyword', '-k', help='Keyword for search command')
     parser.add_argument('--limit', '-l', type=int, default=10, help='Limit number of results')
     parser.add_argument('--feed-name', help='Name for new RSS feed')
     parser.add_argument('--feed-url', help='URL for new RSS feed')
     parser.add_argument('--username', '-u', help='Username for user-specific operations')
-    parser.add_argument('--description', help='Description for preference')
+    parser.add_argument('--description', nargs='+', help='Description(s) for preference; quote each one')
     parser.add_argument('--weight', type=float, default=1.0, help='Weight for preference')
     parser.add_argument('--force', action='store_true', help='Force operation without confirmation prompt')
 
@@ -299,6 +318,9 @@ def main():
                 print("❌ Reading history command requires --username parameter")
                 sys.exit(1)
             tracker.show_reading_history(args.username, args.limit)
+        
+        elif args.command == 'maintenance':
+            tracker.maintenance()
             
     except KeyboardInterrupt:
         print("\n👋 Goodbye!")
@@ -1,10 +1,14 @@
 import sqlite3
-import hashlib
+import math
+import struct
+import threading
 import numpy as np
-from datetime import datetime
+import xxhash
+from contextlib import contextmanager
+from functools import cached_property
+from datetime import datetime, timezone
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
-from embedding_service import EmbeddingService
+from typing import Dict, Iterator, List, Optional, Tuple
 import os
 import logging
 
@@ -27,6 +31,126 @@ class NewsArticle:
     def __repr__(self):
         return f"NewsArticle(title={self.title}, published_date={self.published_date}, category={self.category}, description={self.description})\n"
 
+def _article_from_row(row: tuple, embedding: Optional[np.ndarray] = None) -> NewsArticle:
+    """Build a NewsArticle from columns selected in field order: title, url, description, content,
+    published_date, source, category and optionally content_hash, is_read, user_rating"""
+    title, url, description, content, published, source, category, *extra = row
+    if published is not None:
+        published = datetime.fromtimestamp(published, timezone.utc)
+    if not extra:
+        return NewsArticle(title, url, description, content or "", published, source, category)
+    content_hash, is_read, user_rating = extra
+    if isinstance(content_hash, bytes):
+        content_hash = content_hash.hex()
+    return NewsArticle(title, url, description, content or "", published, source, category,
+                       content_hash, bool(is_read), user_rating, embedding)
+
+def _content_digest(title: str, url: str, description: str) -> bytes:
+    """Hash the identifying fields of an article for duplicate detection (16 raw bytes)"""
+    hasher = xxhash.xxh3_128()
+    hasher.update((title or '').encode())
+    hasher.update((url or '').encode())
+    hasher.update((description or '').encode())
+    return hasher.digest()
+
+class _BloomFilter:
+    """Fixed-size Bloom filter over strings: a miss means never added, a hit means probably added"""
+    
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 1e-4):
+        self.size = int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+    
+    def _positions(self, key: str):
+        # Double hashing: derive every probe from the two 64-bit halves of one 128-bit hash
+        digest = xxhash.xxh3_128_intdigest(key.encode())
+        h1, h2 = digest >> 64, digest & 0xFFFFFFFFFFFFFFFF
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+    
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+    
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+def _apply_pragmas(conn: sqlite3.Connection):
+    """Apply the WAL and caching PRAGMAs every connection to the news database should use"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA mmap_size=268435456")
+
+# Hot statements; the connection's statement cache is keyed by SQL text, so every
+# call reuses the already compiled statement
+_INSERT_ARTICLE_OR_IGNORE_SQL = '''
+    INSERT OR IGNORE INTO articles
+    (title, url, description, content, published_date, source, category, content_hash, embedding)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+_LATEST_ARTICLES_SQL = '''
+    SELECT title, url, description, content, published_date, source, category
+    FROM articles
+    ORDER BY published_date DESC
+    LIMIT ?
+'''
+
+_KEYWORD_SEARCH_SQL = '''
+    SELECT a.title, a.url, a.description, a.content, a.published_date, a.source, a.category
+    FROM articles_fts f
+    JOIN articles a ON a.id = f.rowid
+    WHERE articles_fts MATCH ?
+    ORDER BY rank
+    LIMIT ?
+'''
+
+_ARTICLES_BY_SOURCE_SQL = '''
+    SELECT title, url, description, content, published_date, source, category, content_hash, is_read, user_rating
+    FROM articles
+    WHERE source = ?
+    ORDER BY published_date DESC
+    LIMIT ?
+'''
+
+_CANDIDATE_COLUMNS = 'a.id, a.title, a.url, a.description, a.content, a.published_date, a.source, a.category, a.content_hash, a.is_read, a.user_rating'
+
+_FTS_CANDIDATES_SQL = f'''
+    SELECT {_CANDIDATE_COLUMNS}
+    FROM articles_fts
+    JOIN articles a ON a.id = articles_fts.rowid
+    WHERE articles_fts MATCH ? AND a.embedding IS NOT NULL AND a.published_date > ?
+    ORDER BY rank
+    LIMIT ?
+'''
+
+_RECENT_CANDIDATES_SQL = f'''
+    SELECT {_CANDIDATE_COLUMNS}
+    FROM articles a
+    WHERE a.embedding IS NOT NULL
+    ORDER BY a.published_date DESC
+    LIMIT ?
+'''
+
+# Personalization always scores the newest articles, plus older keyword matches from a recent window
+_PERSONALIZED_RECENT_CANDIDATES = 200
+_PERSONALIZED_FTS_CANDIDATES = 200
+_PERSONALIZED_FTS_WINDOW_SECONDS = 7 * 24 * 3600
+
+# Words too common in preference descriptions to narrow a full-text match
+_PREFERENCE_STOPWORDS = frozenset('''
+    about all and any are but can for from has have how into its more news not new
+    our out than that the their them then there these they this was what when where
+    which who why will with you your
+'''.split())
+
+# Header of the embedding sidecar: magic, row dimension, model name, and the id and xxh3_64 of one
+# covered article's stored embedding blob, so a sidecar left over from another model, dimension
+# or database (e.g. a restored backup) is detected and rebuilt instead of misread
+_EMBEDDING_STORE_MAGIC = b'NTEMB001'
+_EMBEDDING_STORE_HEADER = struct.Struct('<8sIqQ228s')  # 256 bytes, keeps rows 4-byte aligned
+
 class NewsDatabase:
     def __init__(self, db_path: str = None):
         if db_path is None:
@@ -35,280 +159,558 @@ class NewsDatabase:
             db_path = os.path.join(current_dir, "news_tracker.db")
         
         self.db_path = db_path
-        self.embedding_service = EmbeddingService()
+        # Dequantized, unit-length article embeddings as a raw float32 matrix, row = article id - 1
+        self.embeddings_path = os.path.splitext(db_path)[0] + "_embeddings.f32"
+        # A single long-lived connection shared by every method (and by the Flask and
+        # scheduler threads), serialized through a re-entrant lock
+        self._lock = threading.RLock()
+        self._conn = self._connect()
+        # Per-user (preference centroid, search terms); see _get_preference_profile
+        self._pref_cache = {}
+        self._pref_data_version = None
         self.init_database()
+        self._load_url_filter()
+        # With truncation the vector size is known without loading the model, so check it now
+        truncate_dim = int(os.getenv('EMBEDDING_TRUNCATE_DIM', '0'))
+        if truncate_dim:
+            self._check_embedding_dim(truncate_dim)
+    
+    @cached_property
+    def embedding_service(self):
+        """Load the embedding model on first use, so commands that never embed start quickly"""
+        from embedding_service import EmbeddingService
+        service = EmbeddingService()
+        self._check_embedding_dim(service.embedding_dim)
+        return service
+    
+    def _check_embedding_dim(self, dim: int):
+        """Raise if stored embeddings have a different size than the model produces, e.g. after
+        EMBEDDING_TRUNCATE_DIM was changed on an existing database"""
+        for table in ('articles', 'user_preferences'):
+            with self._cursor() as cursor:
+                # Raw records are a 4-byte scale plus one byte per dimension; legacy pickles start with 0x80
+                cursor.execute(f'''
+                    SELECT length(embedding) - 4 FROM {table}
+                    WHERE length(embedding) != ? AND substr(embedding, 1, 1) != x'80'
+                    LIMIT 1
+                ''', (4 + dim,))
+                result = cursor.fetchone()
+            if result:
+                raise ValueError(
+                    f"{table} in {self.db_path} stores {result[0]}-dimensional embeddings but the embedding "
+                    f"model produces {dim}; set EMBEDDING_TRUNCATE_DIM to match the database or use a new one"
+                )
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database connection and apply performance PRAGMAs"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None,
+                               cached_statements=256)
+        # Only takes effect on a new database (before any table exists); see maintenance()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        _apply_pragmas(conn)
+        return conn
+    
+    def connect(self) -> sqlite3.Connection:
+        """Open a separate tuned connection for callers that manage their own transactions;
+        it may be handed between threads (e.g. by the API's connection pool)"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        _apply_pragmas(conn)
+        return conn
+    
+    @contextmanager
+    def _cursor(self):
+        """Yield a cursor on the shared connection for read-only statements"""
+        with self._lock:
+            yield self._conn.cursor()
+    
+    @contextmanager
+    def _transaction(self):
+        """Yield a cursor whose statements are committed together, or rolled back on error"""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+    
+    def close(self):
+        """Let SQLite refresh planner statistics it considers stale, then close the connection"""
+        with self._lock:
+            try:
+                self._conn.execute("PRAGMA optimize")
+            finally:
+                self._conn.close()
+    
+    def analyze(self):
+        """Gather full planner statistics, e.g. after a bulk scrape"""
+        with self._lock:
+            self._conn.execute("ANALYZE")
+    
+    def maintenance(self):
+        """Reclaim free pages, rebuild indexes and refresh planner statistics"""
+        with self._lock:
+            if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # Databases created before incremental auto-vacuum need one full VACUUM to switch modes
+                self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                self._conn.execute("VACUUM")
+            else:
+                # executescript steps the pragma to completion; execute() frees a single page
+                self._conn.executescript("PRAGMA incremental_vacuum")
+            self._conn.execute("INSERT INTO articles_fts(articles_fts) VALUES('optimize')")
+            self._conn.execute("REINDEX")
+            self._conn.execute("ANALYZE")
+        self._upgrade_legacy_embeddings()
+    
+    def _upgrade_legacy_embeddings(self):
+        """Rewrite pickled embeddings from older versions in the raw int8 format, so pickle is never read again"""
+        from embedding_service import is_legacy_embedding
+        for table in ('articles', 'user_preferences'):
+            with self._lock:
+                # Pickles start with the PROTO opcode; only load the model if such rows exist
+                rows = self._conn.execute(
+                    f"SELECT id, embedding FROM {table} WHERE substr(embedding, 1, 1) = x'80'"
+                ).fetchall()
+            rows = [(row_id, blob) for row_id, blob in rows
+                    if is_legacy_embedding(blob, self.embedding_service.embedding_dim)]
+            if not rows:
+                continue
+            
+            service = self.embedding_service
+            with self._transaction() as cursor:
+                cursor.executemany(f"UPDATE {table} SET embedding = ? WHERE id = ?", [
+                    (service.serialize_embedding(service.deserialize_embedding(blob)), row_id)
+                    for row_id, blob in rows
+                ])
+            logger.info(f"Rewrote {len(rows)} legacy pickled embeddings in {table}")
+        self._pref_cache.clear()
+    
+    def _embedding_store_rows(self) -> Optional[int]:
+        """Return the number of rows in the sidecar if its header matches the current model and
+        this database, None if it is missing or must be rebuilt"""
+        service = self.embedding_service
+        try:
+            with open(self.embeddings_path, 'rb') as f:
+                header = f.read(_EMBEDDING_STORE_HEADER.size)
+        except FileNotFoundError:
+            return None
+        if len(header) < _EMBEDDING_STORE_HEADER.size:
+            return None
+        
+        magic, dim, check_id, check_hash, model_name = _EMBEDDING_STORE_HEADER.unpack(header)
+        if (magic != _EMBEDDING_STORE_MAGIC or dim != service.embedding_dim
+                or model_name.rstrip(b'\0').decode() != service.model_name):
+            return None
+        if check_id:
+            row = self._conn.execute('SELECT embedding FROM articles WHERE id = ?', (check_id,)).fetchone()
+            if row is None or row[0] is None or xxhash.xxh3_64_intdigest(row[0]) != check_hash:
+                return None
+        
+        return (os.path.getsize(self.embeddings_path) - _EMBEDDING_STORE_HEADER.size) // (dim * 4)
+    
+    def _sync_embedding_store(self) -> int:
+        """Append embeddings of articles newer than the sidecar file, return the number of rows it holds"""
+        dim = self.embedding_service.embedding_dim
+        row_bytes = dim * 4
+        with self._lock:
+            covered = self._embedding_store_rows()
+            if covered is None:
+                if os.path.exists(self.embeddings_path):
+                    logger.info("Rebuilding the embedding sidecar (model, dimension or database changed)")
+                    os.remove(self.embeddings_path)
+                covered = 0
+            
+            with self._cursor() as cursor:
+                cursor.execute('''
+                    SELECT id, embedding FROM articles
+                    WHERE id > ? AND embedding IS NOT NULL
+                    ORDER BY id
+                ''', (covered,))
+                rows = cursor.fetchall()
+            
+            if not rows:
+                return covered
+            
+            # Ids without an embedding are left as zero rows so every row stays aligned to its id
+            block = np.zeros((rows[-1][0] - covered, dim), dtype=np.float32)
+            ids, blobs = zip(*rows)
+            block[np.asarray(ids) - covered - 1] = self.embedding_service.deserialize_embedding_batch(blobs)
+            # Re-normalize once here (int8 rounding perturbs the norm) so queries can skip it
+            block /= np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+            
+            # Write at a fixed offset rather than appending, so concurrent writers produce the same bytes;
+            # any covered row identifies the database, so the header may name this batch's last one
+            header = _EMBEDDING_STORE_HEADER.pack(_EMBEDDING_STORE_MAGIC, dim, ids[-1], xxhash.xxh3_64_intdigest(blobs[-1]),
+                                                  self.embedding_service.model_name.encode())
+            with open(self.embeddings_path, 'r+b' if covered else 'wb') as f:
+                f.seek(_EMBEDDING_STORE_HEADER.size + covered * row_bytes)
+                f.write(block.tobytes())
+                f.seek(0)
+                f.write(header)
+            
+            return rows[-1][0]
+    
+    def _load_embedding_matrix(self) -> np.ndarray:
+        """Memory-map the article embedding sidecar after bringing it up to date"""
+        rows = self._sync_embedding_store()
+        if rows == 0:
+            return np.empty((0, self.embedding_service.embedding_dim), dtype=np.float32)
+        return np.memmap(self.embeddings_path, dtype=np.float32, mode='r',
+                         offset=_EMBEDDING_STORE_HEADER.size, shape=(rows, self.embedding_service.embedding_dim))
     
     def init_database(self):
         """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Articles table with content field
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS articles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                url TEXT UNIQUE NOT NULL,
-                description TEXT,
-                content TEXT,
-                published_date DATETIME,
-                source TEXT,
-                category TEXT,
-                content_hash TEXT UNIQUE,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                is_read BOOLEAN DEFAULT 0,
-                user_rating REAL DEFAULT 0,
-                embedding BLOB  -- Store embedding vector as binary data
-            )
-        ''')
-        
-        # User preferences table with user_id foreign key
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_preferences (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                description TEXT,
-                weight REAL DEFAULT 1.0,
-                embedding BLOB,  -- Store preference embedding
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # Migration: Add description column and copy data from keyword/category if they exist
-        try:
-            cursor.execute("SELECT keyword FROM user_preferences LIMIT 1")
-            # If this succeeds, we have old schema, need to migrate
-            cursor.execute("ALTER TABLE user_preferences ADD COLUMN description_temp TEXT")
+        with self._transaction() as cursor:
+            # Users table
             cursor.execute('''
-                UPDATE user_preferences 
-                SET description_temp = CASE 
-                    WHEN category IS NOT NULL THEN keyword || ' (Category: ' || category || ')'
-                    ELSE keyword
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    email TEXT UNIQUE,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Articles table with content field
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='articles'")
+            if not cursor.fetchone() and os.path.exists(self.embeddings_path):
+                # Article ids restart in a new database, so the sidecar no longer lines up
+                os.remove(self.embeddings_path)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS articles (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT NOT NULL,
+                    url TEXT UNIQUE NOT NULL,
+                    description TEXT,
+                    content TEXT,
+                    published_date INTEGER,  -- Unix seconds (UTC)
+                    source TEXT,
+                    category TEXT,
+                    content_hash BLOB UNIQUE,  -- Raw 16-byte xxh3_128 digest
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    is_read BOOLEAN DEFAULT 0,
+                    user_rating REAL DEFAULT 0,
+                    embedding BLOB  -- Store embedding vector as binary data
+                )
+            ''')
+            
+            # Indexes for the latest-first listing paths; refresh planner stats when one is new
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='index' AND name IN ('idx_articles_pubdate', 'idx_articles_source_pubdate')")
+            existing_indexes = cursor.fetchone()[0]
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_articles_pubdate ON articles(published_date DESC)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_articles_source_pubdate ON articles(source, published_date DESC)')
+            if existing_indexes < 2:
+                cursor.execute('ANALYZE articles')
+            
+            # User preferences table with user_id foreign key
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_preferences (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    description TEXT,
+                    weight REAL DEFAULT 1.0,
+                    embedding BLOB,  -- Store preference embedding
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+                )
+            ''')
+            
+            # Migration: Add description column and copy data from keyword/category if they exist
+            try:
+                cursor.execute("SELECT keyword FROM user_preferences LIMIT 1")
+                # If this succeeds, we have old schema, need to migrate
+                cursor.execute("ALTER TABLE user_preferences ADD COLUMN description_temp TEXT")
+                cursor.execute('''
+                    UPDATE user_preferences
+                    SET description_temp = CASE
+                        WHEN category IS NOT NULL THEN keyword || ' (Category: ' || category || ')'
+                        ELSE keyword
+                    END
+                ''')
+                cursor.execute("CREATE TABLE user_preferences_new AS SELECT id, user_id, description_temp as description, weight, embedding, created_at FROM user_preferences")
+                cursor.execute("DROP TABLE user_preferences")
+                cursor.execute("ALTER TABLE user_preferences_new RENAME TO user_preferences")
+            except sqlite3.OperationalError:
+                # New schema already in place, no migration needed
+                pass
+            
+            # Migration: Add content column to articles table if it doesn't exist
+            try:
+                cursor.execute("SELECT content FROM articles LIMIT 1")
+            except sqlite3.OperationalError:
+                # Content column doesn't exist, add it
+                cursor.execute("ALTER TABLE articles ADD COLUMN content TEXT")
+                logger.info("Added content column to articles table")
+            
+            # Migration: Convert ISO text published dates to unix seconds
+            cursor.execute("SELECT 1 FROM articles WHERE typeof(published_date) = 'text' LIMIT 1")
+            if cursor.fetchone():
+                cursor.execute('''
+                    UPDATE articles
+                    SET published_date = CAST(strftime('%s', published_date) AS INTEGER)
+                    WHERE typeof(published_date) = 'text'
+                ''')
+                logger.info(f"Converted {cursor.rowcount} article dates to unix timestamps")
+            
+            # Migration: Replace hex text content hashes (MD5 or xxh3) with raw xxh3_128 digests
+            cursor.execute("SELECT id, title, url, description FROM articles WHERE typeof(content_hash) = 'text'")
+            legacy_hashes = cursor.fetchall()
+            if legacy_hashes:
+                cursor.executemany(
+                    'UPDATE articles SET content_hash = ? WHERE id = ?',
+                    [(_content_digest(title, url, description), article_id)
+                     for article_id, title, url, description in legacy_hashes]
+                )
+                logger.info(f"Converted {len(legacy_hashes)} article content hashes to binary digests")
+            
+            # Reading history table with user_id foreign key
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS reading_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    article_id INTEGER,
+                    action TEXT, -- 'clicked', 'read', 'dismissed'
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                    FOREIGN KEY (article_id) REFERENCES articles (id)
+                )
+            ''')
+            
+            # Per-user lookups: newest-first history and preference loads (after the preference table migration)
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='index' AND name IN ('idx_history_user_time', 'idx_prefs_user')")
+            existing_indexes = cursor.fetchone()[0]
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_user_time ON reading_history(user_id, timestamp DESC)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_prefs_user ON user_preferences(user_id)')
+            if existing_indexes < 2:
+                cursor.execute('ANALYZE reading_history')
+                cursor.execute('ANALYZE user_preferences')
+            
+            # HTTP validators per feed so unchanged feeds can be skipped with a conditional GET
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS feed_cache (
+                    feed_url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT
+                )
+            ''')
+            
+            # Full-text index over article title/description, kept in sync by triggers
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='articles_fts'")
+            fts_exists = cursor.fetchone() is not None
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+                    title,
+                    description,
+                    content='articles',
+                    content_rowid='id',
+                    tokenize='porter unicode61'
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS articles_fts_ai AFTER INSERT ON articles BEGIN
+                    INSERT INTO articles_fts(rowid, title, description)
+                    VALUES (new.id, new.title, new.description);
                 END
             ''')
-            cursor.execute("CREATE TABLE user_preferences_new AS SELECT id, user_id, description_temp as description, weight, embedding, created_at FROM user_preferences")
-            cursor.execute("DROP TABLE user_preferences")
-            cursor.execute("ALTER TABLE user_preferences_new RENAME TO user_preferences")
-        except sqlite3.OperationalError:
-            # New schema already in place, no migration needed
-            pass
-        
-        # Migration: Add content column to articles table if it doesn't exist
-        try:
-            cursor.execute("SELECT content FROM articles LIMIT 1")
-        except sqlite3.OperationalError:
-            # Content column doesn't exist, add it
-            cursor.execute("ALTER TABLE articles ADD COLUMN content TEXT")
-            logger.info("Added content column to articles table")
-        
-        # Reading history table with user_id foreign key
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reading_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                article_id INTEGER,
-                action TEXT, -- 'clicked', 'read', 'dismissed'
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-                FOREIGN KEY (article_id) REFERENCES articles (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS articles_fts_ad AFTER DELETE ON articles BEGIN
+                    INSERT INTO articles_fts(articles_fts, rowid, title, description)
+                    VALUES ('delete', old.id, old.title, old.description);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS articles_fts_au AFTER UPDATE ON articles BEGIN
+                    INSERT INTO articles_fts(articles_fts, rowid, title, description)
+                    VALUES ('delete', old.id, old.title, old.description);
+                    INSERT INTO articles_fts(rowid, title, description)
+                    VALUES (new.id, new.title, new.description);
+                END
+            ''')
+            if not fts_exists:
+                # Backfill the index from articles that predate the FTS table
+                cursor.execute("INSERT INTO articles_fts(articles_fts) VALUES('rebuild')")
+                logger.info("Built full-text index for articles")
+    
+    def _load_url_filter(self):
+        """Seed the Bloom filter of known article urls used to skip re-scraped articles"""
+        self._url_filter = _BloomFilter()
+        with self._cursor() as cursor:
+            cursor.execute('SELECT url FROM articles')
+            while rows := cursor.fetchmany(4096):
+                for (url,) in rows:
+                    self._url_filter.add(url)
+    
+    def _drop_known_articles(self, articles: List[NewsArticle]) -> List[NewsArticle]:
+        """Return the articles whose url is not stored yet, before any embedding work is spent on them"""
+        # A filter miss is definitely new; hits may be false positives, so confirm them in SQL
+        maybe_known = list({a.url for a in articles if a.url in self._url_filter})
+        if not maybe_known:
+            return articles
+        
+        known = set()
+        with self._cursor() as cursor:
+            for start in range(0, len(maybe_known), 500):
+                chunk = maybe_known[start:start + 500]
+                cursor.execute(f"SELECT url FROM articles WHERE url IN ({','.join('?' * len(chunk))})", chunk)
+                known.update(url for (url,) in cursor.fetchall())
+        
+        return [a for a in articles if a.url not in known]
     
     def add_article(self, article: NewsArticle) -> bool:
         """Add a new article to the database with embedding, return True if added, False if duplicate"""
-        # Generate content hash to avoid duplicates
-        content_for_hash = f"{article.title}{article.url}{article.description}"
-        article.content_hash = hashlib.md5(content_for_hash.encode()).hexdigest()
+        return self.add_articles([article]) == 1
+    
+    def add_articles(self, articles: List[NewsArticle]) -> int:
+        """Add a batch of articles with embeddings in a single transaction, return the number of new articles"""
+        articles = self._drop_known_articles(articles)
+        if not articles:
+            return 0
         
-        # Generate embedding
-        article.embedding = self.embedding_service.create_article_embedding(
-            article.title, article.description, article.category
+        embeddings = self.embedding_service.create_article_embedding_batch(
+            [a.title for a in articles], [a.description for a in articles], [a.category for a in articles]
         )
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT INTO articles 
-                (title, url, description, content, published_date, source, category, content_hash, embedding)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+        rows = []
+        for article, embedding in zip(articles, embeddings):
+            content_hash = _content_digest(article.title, article.url, article.description)
+            article.content_hash = content_hash.hex()
+            article.embedding = embedding
+            rows.append((
                 article.title,
                 article.url,
                 article.description,
                 article.content,
-                article.published_date,
+                int(article.published_date.timestamp()) if article.published_date else None,
                 article.source,
                 article.category,
-                article.content_hash,
+                content_hash,
                 self.embedding_service.serialize_embedding(article.embedding)
             ))
-            conn.commit()
-            return True
-        except sqlite3.IntegrityError:
-            # Article already exists
-            return False
-        finally:
-            conn.close()
+        
+        # Duplicates (by url or content_hash) are skipped by OR IGNORE instead of aborting the batch
+        with self._transaction() as cursor:
+            cursor.executemany(_INSERT_ARTICLE_OR_IGNORE_SQL, rows)
+            added = cursor.rowcount
+        
+        for article in articles:
+            self._url_filter.add(article.url)
+        return added
     
     def get_latest_articles(self, limit: int = 50) -> List[NewsArticle]:
         """Get the latest articles from the database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT title, url, description, content, published_date, source, category
-            FROM articles
-            ORDER BY published_date DESC
-            LIMIT ?
-        ''', (limit,))
-        
-        articles = []
-        for row in cursor.fetchall():
-            articles.append(NewsArticle(
-                title=row[0],
-                url=row[1],
-                description=row[2],
-                content=row[3] or "",
-                published_date=datetime.fromisoformat(row[4]) if row[4] else None,
-                source=row[5],
-                category=row[6]
-            ))
+        return list(self.iter_latest_articles(limit))
+    
+    def iter_latest_articles(self, limit: int = 50, chunk_size: int = 256) -> Iterator[NewsArticle]:
+        """Yield the latest articles, fetching rows in chunks and only holding the lock per chunk"""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute(_LATEST_ARTICLES_SQL, (limit,))
         
-        conn.close()
-        return articles
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            
+            yield from map(_article_from_row, rows)
     
     def get_articles_by_keyword(self, keyword: str, limit: int = 20) -> List[NewsArticle]:
-        """Search articles by keyword in title or description"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT title, url, description, content, published_date, source, category
-            FROM articles
-            WHERE title LIKE ? OR description LIKE ?
-            ORDER BY published_date DESC
-            LIMIT ?
-        ''', (f'%{keyword}%', f'%{keyword}%', limit))
-        
-        articles = []
-        for row in cursor.fetchall():
-            articles.append(NewsArticle(
-                title=row[0],
-                url=row[1],
-                description=row[2],
-                content=row[3] or "",
-                published_date=datetime.fromisoformat(row[4]) if row[4] else None,
-                source=row[5],
-                category=row[6]
-            ))
+        """Search articles by keyword in title or description, best matches first"""
+        with self._cursor() as cursor:
+            cursor.execute(_KEYWORD_SEARCH_SQL, (self._fts_phrase(keyword), limit))
+            rows = cursor.fetchall()
         
-        conn.close()
-        return articles
+        return [_article_from_row(row) for row in rows]
+    
+    def _fts_phrase(self, keyword: str) -> str:
+        """Quote a keyword as an FTS5 phrase so operator characters (-, *, :) are matched literally"""
+        return '"' + keyword.replace('"', '""') + '"'
     
     def get_articles_by_source(self, source: str, limit: int = 20) -> List[NewsArticle]:
         """Get articles by source"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT title, url, description, content, published_date, source, category, content_hash, is_read, user_rating
-            FROM articles
-            WHERE source = ?
-            ORDER BY published_date DESC
-            LIMIT ?
-        ''', (source, limit))
-        
-        articles = []
-        for row in cursor.fetchall():
-            articles.append(NewsArticle(
-                title=row[0],
-                url=row[1],
-                description=row[2],
-                content=row[3] or "",
-                published_date=datetime.fromisoformat(row[4]) if row[4] else None,
-                source=row[5],
-                category=row[6],
-                content_hash=row[7],
-                is_read=bool(row[8]) if row[8] is not None else False,
-                user_rating=row[9]
-            ))
+        with self._cursor() as cursor:
+            cursor.execute(_ARTICLES_BY_SOURCE_SQL, (source, limit))
+            rows = cursor.fetchall()
         
-        conn.close()
-        return articles
+        return [_article_from_row(row) for row in rows]
     
     def get_articles_with_embeddings(self, limit: int = 100) -> List[NewsArticle]:
         """Get articles with their embeddings"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT title, url, description, content, published_date, source, category, content_hash, is_read, user_rating, embedding
-            FROM articles
-            WHERE embedding IS NOT NULL
-            ORDER BY published_date DESC
-            LIMIT ?
-        ''', (limit,))
-        
-        articles = []
-        for row in cursor.fetchall():
-            embedding = None
-            if row[10]:  # embedding column
-                embedding = self.embedding_service.deserialize_embedding(row[10])
-            
-            articles.append(NewsArticle(
-                title=row[0],
-                url=row[1],
-                description=row[2],
-                content=row[3] or "",
-                published_date=datetime.fromisoformat(row[4]) if row[4] else None,
-                source=row[5],
-                category=row[6],
-                content_hash=row[7],
-                is_read=bool(row[8]) if row[8] is not None else False,
-                user_rating=row[9],
-                embedding=embedding
-            ))
+        with self._cursor() as cursor:
+            cursor.execute(_RECENT_CANDIDATES_SQL, (limit,))
+            rows = cursor.fetchall()
+        
+        return self._attach_embeddings(rows)[0]
+    
+    def _attach_embeddings(self, rows: List[tuple]) -> Tuple[List[NewsArticle], np.ndarray]:
+        """Build articles from (id, *article columns) rows with embeddings gathered from the sidecar,
+        also returning the gathered (len(rows), D) matrix"""
+        if not rows:
+            return [], np.empty((0, self.embedding_service.embedding_dim), dtype=np.float32)
         
-        conn.close()
-        return articles
+        article_matrix = self._load_embedding_matrix()[[row[0] - 1 for row in rows]]
+        articles = [_article_from_row(row[1:], embedding) for row, embedding in zip(rows, article_matrix)]
+        return articles, article_matrix
     
-    def add_user_preference_with_embedding(self, username: str, description: str, 
+    def add_user_preference_with_embedding(self, username: str, description: str,
                                          weight: float = 1.0):
         """Add user preference with embedding for specific user"""
-        user_id = self.get_or_create_user(username)
-        embedding = self.embedding_service.create_preference_embedding(description)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self.add_user_preferences_with_embeddings(username, [(description, weight)])
+    
+    def add_user_preferences_with_embeddings(self, username: str, preferences: List[Tuple[str, float]]):
+        """Add several (description, weight) preferences for a user, embedding them in one batch"""
+        if not preferences:
+            return
         
-        cursor.execute('''
-            INSERT INTO user_preferences (user_id, description, weight, embedding)
-            VALUES (?, ?, ?, ?)
-        ''', (
-            user_id,
-            description,
-            weight,
-            self.embedding_service.serialize_embedding(embedding)
-        ))
+        embeddings = self.embedding_service.create_preference_embedding_batch(
+            [description for description, _ in preferences]
+        )
         
-        conn.commit()
-        conn.close()
+        with self._transaction() as cursor:
+            user_id = self._upsert_user(cursor, username)
+            cursor.executemany('''
+                INSERT INTO user_preferences (user_id, description, weight, embedding)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (user_id, description, weight, self.embedding_service.serialize_embedding(embedding))
+                for (description, weight), embedding in zip(preferences, embeddings)
+            ])
+        self._pref_cache.pop(user_id, None)
+    
+    def _get_preference_profile(self, user_id: int) -> Optional[Tuple[np.ndarray, set]]:
+        """Get a user's weighted preference centroid and full-text terms, cached until preferences change"""
+        with self._lock:
+            # data_version moves when another connection (the API's, another process) commits,
+            # which may have edited preferences; writes through this connection invalidate directly
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._pref_data_version:
+                self._pref_cache.clear()
+                self._pref_data_version = data_version
+            
+            if user_id not in self._pref_cache:
+                with self._cursor() as cursor:
+                    cursor.execute('''
+                        SELECT embedding, weight, description FROM user_preferences
+                        WHERE user_id = ? AND embedding IS NOT NULL
+                    ''', (user_id,))
+                    preferences = cursor.fetchall()
+                
+                profile = None
+                if preferences:
+                    profile = (
+                        self.embedding_service.preference_centroid(
+                            self.embedding_service.deserialize_embedding_batch([b for b, _, _ in preferences]),
+                            np.array([w for _, w, _ in preferences], dtype=np.float32)
+                        ),
+                        {word for _, _, description in preferences
+                         for word in (description or '').lower().split()
+                         if len(word) > 2 and word not in _PREFERENCE_STOPWORDS}
+                    )
+                self._pref_cache[user_id] = profile
+            
+            return self._pref_cache[user_id]
     
     def get_personalized_articles(self, username: str, limit: int = 20) -> List[Tuple[NewsArticle, float]]:
         """Get articles ranked by user preferences using embeddings for specific user"""
@@ -318,42 +720,41 @@ class NewsDatabase:
             return [(article, 0.0) for article in self.get_latest_articles(limit)]
         
         # Get user preferences
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT embedding, weight FROM user_preferences 
-            WHERE user_id = ? AND embedding IS NOT NULL
-        ''', (user_id,))
-        preferences = cursor.fetchall()
-        
-        if not preferences:
+        profile = self._get_preference_profile(user_id)
+        if profile is None:
             # No preferences set, return latest articles
             return [(article, 0.0) for article in self.get_latest_articles(limit)]
+        centroid, terms = profile
         
-        # Get articles with embeddings
-        articles = self.get_articles_with_embeddings(200)  # Get more to rank
-        
-        # Calculate scores for each article
-        scored_articles = []
-        for article in articles:
-            if article.embedding is None:
-                continue
-                
-            total_score = 0.0
-            for pref_embedding_bytes, weight in preferences:
-                pref_embedding = self.embedding_service.deserialize_embedding(pref_embedding_bytes)
-                similarity = self.embedding_service.calculate_similarity(
-                    article.embedding, pref_embedding
-                )
-                total_score += similarity * weight
+        # Always score the most recent articles, then add the best full-text matches on the
+        # preference terms from the recent window only; embeddings come from the sidecar
+        with self._cursor() as cursor:
+            cursor.execute(_RECENT_CANDIDATES_SQL, (_PERSONALIZED_RECENT_CANDIDATES,))
+            rows = cursor.fetchall()
             
-            scored_articles.append((article, total_score))
+            if terms:
+                since = int(datetime.now(timezone.utc).timestamp()) - _PERSONALIZED_FTS_WINDOW_SECONDS
+                match = ' OR '.join(self._fts_phrase(term) for term in sorted(terms))
+                cursor.execute(_FTS_CANDIDATES_SQL, (match, since, _PERSONALIZED_FTS_CANDIDATES))
+                seen = {row[0] for row in rows}
+                rows += [row for row in cursor.fetchall() if row[0] not in seen]
+        
+        if not rows:
+            return []
         
-        # Sort by score and return top articles
-        scored_articles.sort(key=lambda x: x[1], reverse=True)
-        conn.close()
-        return scored_articles[:limit]
+        articles, article_matrix = self._attach_embeddings(rows)
+        
+        # Sidecar rows are unit length, so one matrix-vector product against the cached centroid
+        # gives every article's weighted similarity to all preferences
+        scores = np.asarray(article_matrix) @ centroid
+        
+        # Select the top articles without sorting the whole candidate list
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(articles[i], float(scores[i])) for i in top]
     
     def get_user_preferences(self, username: str) -> List[Tuple[str, float]]:
         """Get all preferences for a specific user"""
@@ -361,16 +762,13 @@ class NewsDatabase:
         if user_id is None:
             return []
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT description, weight FROM user_preferences 
-            WHERE user_id = ? ORDER BY created_at DESC
-        ''', (user_id,))
-        preferences = cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT description, weight FROM user_preferences
+                WHERE user_id = ? ORDER BY created_at DESC
+            ''', (user_id,))
+            preferences = cursor.fetchall()
         
-        conn.close()
         return preferences
     
     def get_user_preferences_with_ids(self, username: str) -> List[Tuple[int, str, float]]:
@@ -379,121 +777,163 @@ class NewsDatabase:
         if user_id is None:
             return []
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, description, weight FROM user_preferences 
-            WHERE user_id = ? ORDER BY created_at DESC
-        ''', (user_id,))
-        preferences = cursor.fetchall()
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT id, description, weight FROM user_preferences
+                WHERE user_id = ? ORDER BY created_at DESC
+            ''', (user_id,))
+            preferences = cursor.fetchall()
         
-        conn.close()
         return preferences
     
     def add_reading_history(self, username: str, article_id: int, action: str):
         """Add reading history for a specific user"""
-        user_id = self.get_or_create_user(username)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO reading_history (user_id, article_id, action)
-            VALUES (?, ?, ?)
-        ''', (user_id, article_id, action))
+        self.add_reading_history_batch(username, [article_id], action)
+    
+    def add_reading_history_batch(self, username: str, article_ids: List[int], action: str):
+        """Add the same reading history action for several articles in one transaction"""
+        with self._transaction() as cursor:
+            user_id = self._upsert_user(cursor, username)
+            cursor.executemany('''
+                INSERT INTO reading_history (user_id, article_id, action)
+                VALUES (?, ?, ?)
+            ''', [(user_id, article_id, action) for article_id in article_ids])
+    
+    def get_article_ids_by_url(self, urls: List[str]) -> Dict[str, int]:
+        """Map each stored url among `urls` to its article id; unknown urls are left out"""
+        unique_urls = list(dict.fromkeys(urls))
+        ids = {}
+        with self._cursor() as cursor:
+            for start in range(0, len(unique_urls), 500):
+                chunk = unique_urls[start:start + 500]
+                cursor.execute(f"SELECT url, id FROM articles WHERE url IN ({','.join('?' * len(chunk))})", chunk)
+                ids.update(cursor.fetchall())
         
-        conn.commit()
-        conn.close()
+        return ids
     
     def get_article_count(self) -> int:
         """Get total number of articles in database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM articles')
+            count = cursor.fetchone()[0]
         
-        cursor.execute('SELECT COUNT(*) FROM articles')
-        count = cursor.fetchone()[0]
+        return count
+    
+    def get_recent_article_count(self, since: datetime) -> int:
+        """Get number of articles published after the given time"""
+        with self._cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM articles WHERE published_date > ?', (int(since.timestamp()),))
+            count = cursor.fetchone()[0]
         
-        conn.close()
         return count
     
+    def get_top_sources(self, since: datetime, limit: int = 5) -> List[Tuple[str, int]]:
+        """Get the sources with the most articles published after the given time"""
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT source, COUNT(*) FROM articles
+                WHERE published_date > ?
+                GROUP BY source
+                ORDER BY 2 DESC
+                LIMIT ?
+            ''', (int(since.timestamp()), limit))
+            sources = cursor.fetchall()
+        
+        return sources
+    
+    def get_stats(self, since: datetime, top_sources: int = 5) -> Tuple[int, int, List[Tuple[str, int]]]:
+        """Get (total articles, articles published after `since`, top sources since then) in one pass"""
+        cutoff = int(since.timestamp())
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT COUNT(*), COUNT(*) FILTER (WHERE published_date > ?) FROM articles
+            ''', (cutoff,))
+            total, recent = cursor.fetchone()
+        
+        return total, recent, self.get_top_sources(since, top_sources) if recent else []
+    
     def delete_old_articles(self, days_old: int = 3) -> int:
         """Delete articles older than specified number of days and return count of deleted articles"""
         from datetime import datetime, timedelta
         
         cutoff_date = datetime.now() - timedelta(days=days_old)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
+        with self._transaction() as cursor:
             # First, get the count of articles that will be deleted
             cursor.execute('''
-                SELECT COUNT(*) FROM articles 
+                SELECT COUNT(*) FROM articles
                 WHERE published_date < ? OR published_date IS NULL
-            ''', (cutoff_date.isoformat(),))
+            ''', (int(cutoff_date.timestamp()),))
             count_to_delete = cursor.fetchone()[0]
             
             # Delete the old articles
             cursor.execute('''
-                DELETE FROM articles 
+                DELETE FROM articles
                 WHERE published_date < ? OR published_date IS NULL
-            ''', (cutoff_date.isoformat(),))
-            
-            conn.commit()
-            return count_to_delete
-            
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+            ''', (int(cutoff_date.timestamp()),))
+        
+        return count_to_delete
     
     def create_user(self, username: str, email: str = None) -> int:
         """Create a new user and return user ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                INSERT INTO users (username, email)
-                VALUES (?, ?)
-            ''', (username, email))
-            user_id = cursor.lastrowid
-            conn.commit()
+            with self._transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO users (username, email)
+                    VALUES (?, ?)
+                ''', (username, email))
+                user_id = cursor.lastrowid
             return user_id
         except sqlite3.IntegrityError:
             raise ValueError(f"Username '{username}' already exists")
-        finally:
-            conn.close()
+    
+    def get_feed_validators(self, feed_url: str) -> Tuple[Optional[str], Optional[str]]:
+        """Get the (ETag, Last-Modified) pair stored for a feed from its last successful scrape"""
+        with self._cursor() as cursor:
+            cursor.execute('SELECT etag, last_modified FROM feed_cache WHERE feed_url = ?', (feed_url,))
+            result = cursor.fetchone()
+        
+        return result if result else (None, None)
+    
+    def set_feed_validators(self, feed_url: str, etag: Optional[str], last_modified: Optional[str]):
+        """Remember the ETag and Last-Modified headers a feed was last fetched with"""
+        with self._transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO feed_cache (feed_url, etag, last_modified) VALUES (?, ?, ?)
+                ON CONFLICT(feed_url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified
+            ''', (feed_url, etag, last_modified))
     
     def get_user_id(self, username: str) -> Optional[int]:
         """Get user ID by username"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
-        result = cursor.fetchone()
+        with self._cursor() as cursor:
+            cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
+            result = cursor.fetchone()
         
-        conn.close()
         return result[0] if result else None
     
     def get_or_create_user(self, username: str, email: str = None) -> int:
         """Get existing user ID or create new user"""
-        user_id = self.get_user_id(username)
-        if user_id is None:
-            user_id = self.create_user(username, email)
-        return user_id
+        with self._transaction() as cursor:
+            return self._upsert_user(cursor, username, email)
+    
+    @staticmethod
+    def _upsert_user(cursor: sqlite3.Cursor, username: str, email: str = None) -> int:
+        """Return the user's id, inserting the user first if needed, in the caller's transaction"""
+        # Look up first: an upsert would rewrite the row and burn an AUTOINCREMENT id on every hit
+        cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
+        result = cursor.fetchone()
+        if result:
+            return result[0]
+        
+        cursor.execute('INSERT INTO users (username, email) VALUES (?, ?) RETURNING id', (username, email))
+        return cursor.fetchone()[0]
     
     def list_users(self) -> List[Tuple[int, str, str]]:
         """List all users"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._cursor() as cursor:
+            cursor.execute('SELECT id, username, email FROM users ORDER BY username')
+            users = cursor.fetchall()
         
-        cursor.execute('SELECT id, username, email FROM users ORDER BY username')
-        users = cursor.fetchall()
-        
-        conn.close()
         return users
     
     def delete_user(self, username: str, confirm: bool = False) -> bool:
@@ -517,60 +957,43 @@ class NewsDatabase:
                 print("User deletion cancelled.")
                 return False
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            # Due to CASCADE DELETE, deleting the user will automatically delete:
-            # - user_preferences (FOREIGN KEY with ON DELETE CASCADE)
-            # - reading_history (FOREIGN KEY with ON DELETE CASCADE)
-            
-            cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
+            with self._transaction() as cursor:
+                # Due to CASCADE DELETE, deleting the user will automatically delete:
+                # - user_preferences (FOREIGN KEY with ON DELETE CASCADE)
+                # - reading_history (FOREIGN KEY with ON DELETE CASCADE)
+                
+                cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
+                deleted = cursor.rowcount
+            self._pref_cache.pop(user_id, None)
             
-            if cursor.rowcount == 0:
+            if deleted == 0:
                 print(f"Failed to delete user '{username}'")
                 return False
             
-            conn.commit()
             print(f"✅ User '{username}' and all related data deleted successfully!")
             return True
-            
+        
         except Exception as e:
             print(f"❌ Error deleting user '{username}': {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
     
     def get_user_deletion_stats(self, username: str) -> dict:
         """Get statistics about what will be deleted for a user"""
-        user_id = self.get_user_id(username)
-        if user_id is None:
-            return {}
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        stats = {}
-        
-        # Get user info
-        cursor.execute('SELECT username, email, created_at FROM users WHERE id = ?', (user_id,))
-        user_info = cursor.fetchone()
-        if user_info:
-            stats['username'] = user_info[0]
-            stats['email'] = user_info[1]
-            stats['created_at'] = user_info[2]
-        
-        # Count preferences
-        cursor.execute('SELECT COUNT(*) FROM user_preferences WHERE user_id = ?', (user_id,))
-        stats['preferences'] = cursor.fetchone()[0]
+        with self._cursor() as cursor:
+            cursor.execute('''
+                SELECT u.username, u.email, u.created_at,
+                       (SELECT COUNT(*) FROM user_preferences WHERE user_id = u.id),
+                       (SELECT COUNT(*) FROM reading_history WHERE user_id = u.id)
+                FROM users u
+                WHERE u.username = ?
+            ''', (username,))
+            row = cursor.fetchone()
         
-        # Count reading history
-        cursor.execute('SELECT COUNT(*) FROM reading_history WHERE user_id = ?', (user_id,))
-        stats['reading_history'] = cursor.fetchone()[0]
+        if row is None:
+            return {}
         
-        conn.close()
-        return stats
+        return dict(zip(('username', 'email', 'created_at', 'preferences', 'reading_history'), row))
     
     def user_exists(self, username: str) -> bool:
         """Check if a user exists in the database"""
@@ -587,34 +1010,21 @@ class NewsDatabase:
     def get_user_reading_history(self, username, limit=50):
         """Get reading history for a specific user"""
         query = """
-        SELECT a.id, a.title, a.url, a.description, a.published_date, 
-               a.source, a.category, rh.read_date
+        SELECT a.title, a.url, COALESCE(a.description, ''), a.content, a.published_date,
+               a.source, a.category, rh.timestamp
         FROM reading_history rh
         JOIN articles a ON rh.article_id = a.id
         JOIN users u ON rh.user_id = u.id
         WHERE u.username = ?
-        ORDER BY rh.read_date DESC
+        ORDER BY rh.timestamp DESC
         LIMIT ?
         """
         
-        cursor = self.conn.cursor()
-        cursor.execute(query, (username, limit))
-        rows = cursor.fetchall()
-        
-        history = []
-        for row in rows:
-            article = NewsArticle(
-                title=row[1],
-                url=row[2],
-                description=row[3] or "",
-                published_date=datetime.fromisoformat(row[4]) if row[4] else None,
-                source=row[5],
-                category=row[6]
-            )
-            read_date = datetime.fromisoformat(row[7])
-            history.append((article, read_date))
-        
-        return history
+        with self._cursor() as cursor:
+            cursor.execute(query, (username, limit))
+            rows = cursor.fetchall()
+        
+        return [(_article_from_row(row[:7]), datetime.fromisoformat(row[7])) for row in rows]
 
 # Example usage
 if __name__ == "__main__":
@@ -1,9 +1,12 @@
+import re
 import feedparser
 import requests
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from typing import Dict, List, Optional
 from urllib.parse import urljoin
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Import NewsArticle from the correct location
 try:
@@ -13,14 +16,38 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# One pass over the common RFC 2822 ("Tue, 10 Jun 2025 10:00:00 +0000") and
+# ISO 8601 ("2025-06-10T10:00:00Z") shapes; anything else takes the slow path
+_DATE_RE = re.compile(
+    r'(?:\w{3},\s*)?(?P<d>\d{1,2})\s+(?P<mon>\w{3})\s+(?P<y>\d{4})\s+'
+    r'(?P<H>\d{2}):(?P<M>\d{2}):(?P<S>\d{2})\s*(?P<tz>[+\-]\d{4}|GMT|UTC|UT|Z)?'
+    r'|(?P<iy>\d{4})-(?P<im>\d{2})-(?P<id>\d{2})[T ](?P<iH>\d{2}):(?P<iM>\d{2}):(?P<iS>\d{2})'
+    r'(?:\.\d+)?(?P<iz>Z|[+\-]\d{2}:?\d{2})?'
+)
+_MONTHS = {name: i for i, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), 1)}
+
+
+def _utc_offset(tz: Optional[str]) -> timedelta:
+    """Offset for a '+hhmm' / '+hh:mm' / 'Z' / 'GMT' suffix (missing means UTC)"""
+    if not tz or tz[0] not in '+-':
+        return timedelta(0)
+    digits = tz[1:].replace(':', '')
+    offset = timedelta(hours=int(digits[:2]), minutes=int(digits[2:]))
+    return -offset if tz[0] == '-' else offset
+
 class NewsScraper:
     def __init__(self, database):
         """Initialize the news scraper with a database connection"""
         self.db = database
+        self.max_workers = 8
+        self.timeout = 10
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'NewsTracker/1.0 (RSS Feed Reader)'
         })
+        # Validators from the latest fetch of each feed, saved once its articles are stored
+        self._pending_validators = {}
         
         # Default RSS feeds - you can expand this list
         self.rss_feeds = {
@@ -50,41 +77,70 @@ class NewsScraper:
         
         results = {}
         
-        for feed_name, feed_url in self.rss_feeds.items():
-            try:
-                logger.info(f"Scraping {feed_name}...")
-                count = self.scrape_feed(feed_name, feed_url)
-                results[feed_name] = count
-                logger.info(f"Found {count} new articles from {feed_name}")
-            except Exception as e:
-                logger.error(f"Error scraping {feed_name}: {e}")
-                results[feed_name] = 0
+        # Fetch and parse feeds concurrently (network-bound, different hosts); insert each
+        # feed's articles on this thread as it completes so embedding stays serial
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.fetch_feed_articles, feed_name, feed_url): feed_name
+                for feed_name, feed_url in self.rss_feeds.items()
+            }
+            for future in as_completed(futures):
+                feed_name = futures[future]
+                try:
+                    count = self.db.add_articles(future.result())
+                    self._save_validators(self.rss_feeds[feed_name])
+                    results[feed_name] = count
+                    logger.info(f"Found {count} new articles from {feed_name}")
+                except Exception as e:
+                    logger.error(f"Error scraping {feed_name}: {e}")
+                    results[feed_name] = 0
         
         return results
     
     def scrape_feed(self, feed_name: str, feed_url: str) -> int:
         """Scrape a single RSS feed and return count of new articles"""
-        try:
-            # Parse the RSS feed
-            feed = feedparser.parse(feed_url)
-            
-            if feed.bozo:
-                logger.warning(f"Feed {feed_name} has parsing issues: {feed.bozo_exception}")
-            
-            new_articles_count = 0
-            
-            for entry in feed.entries:
-                article = self._parse_entry(entry, feed_name)
-                if article:
-                    # Try to add article to database
-                    if self.db.add_article(article):
-                        new_articles_count += 1
-            
-            return new_articles_count
-            
-        except Exception as e:
-            logger.error(f"Failed to scrape feed {feed_name}: {e}")
-            raise
+        # Add the whole feed in one batch; duplicates are skipped by the database
+        count = self.db.add_articles(self.fetch_feed_articles(feed_name, feed_url))
+        self._save_validators(feed_url)
+        return count
+    
+    def fetch_feed_articles(self, feed_name: str, feed_url: str) -> List[NewsArticle]:
+        """Download and parse a single RSS feed into articles without touching the database;
+        errors propagate, so the caller reports a failed feed"""
+        logger.info(f"Scraping {feed_name}...")
+        # Conditional GET: feeds that have not changed since the last scrape answer 304
+        etag, last_modified = self.db.get_feed_validators(feed_url)
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        
+        # Download with requests (releases the GIL while waiting), then parse the bytes
+        response = self.session.get(feed_url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            logger.info(f"{feed_name} has not changed since the last scrape")
+            return []
+        response.raise_for_status()
+        feed = feedparser.parse(response.content)
+        self._pending_validators[feed_url] = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        
+        if feed.bozo:
+            logger.warning(f"Feed {feed_name} has parsing issues: {feed.bozo_exception}")
+        
+        articles = []
+        for entry in feed.entries:
+            article = self._parse_entry(entry, feed_name)
+            if article:
+                articles.append(article)
+        
+        return articles
+    
+    def _save_validators(self, feed_url: str):
+        """Persist the validators of a fetched feed once its articles have been stored"""
+        validators = self._pending_validators.pop(feed_url, None)
+        if validators is not None:
+            self.db.set_feed_validators(feed_url, *validators)
     
     def _parse_entry(self, entry, source: str) -> Optional[NewsArticle]:
         """Parse a single RSS entry into a NewsArticle"""
@@ -142,6 +198,10 @@ class NewsScraper:
                 except (ValueError, TypeError):
                     pass
             
+            # Fall back to the raw date string when feedparser could not parse it
+            if not published_date:
+                published_date = self._parse_date(entry.get('published') or entry.get('updated'))
+            
             # If still no date, use current time
             if not published_date:
                 published_date = datetime.now(timezone.utc)
@@ -172,6 +232,37 @@ class NewsScraper:
             logger.error(f"Error parsing RSS entry: {e}")
             return None
     
+    def _parse_date(self, value: Optional[str]) -> Optional[datetime]:
+        """Parse an RFC 2822 or ISO 8601 date string, return None if it is neither"""
+        if not value:
+            return None
+        
+        value = value.strip()
+        match = _DATE_RE.fullmatch(value)
+        try:
+            if match and match['y']:
+                # RFC 2822, as used by RSS pubDate
+                parsed = datetime(int(match['y']), _MONTHS[match['mon'].title()], int(match['d']),
+                                  int(match['H']), int(match['M']), int(match['S']), tzinfo=timezone.utc)
+                return parsed - _utc_offset(match['tz'])
+            if match:
+                # ISO 8601, as used by Atom
+                parsed = datetime(int(match['iy']), int(match['im']), int(match['id']),
+                                  int(match['iH']), int(match['iM']), int(match['iS']), tzinfo=timezone.utc)
+                return parsed - _utc_offset(match['iz'])
+            
+            # Slow path for named zones ("EST"), date-only ISO values and other variants
+            if value[4:5] == '-':
+                parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            else:
+                parsed = parsedate_to_datetime(value)
+        except (KeyError, TypeError, ValueError):
+            return None
+        
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc)
+    
     def _clean_html(self, text: str) -> str:
         """Remove HTML tags and clean up text"""
         if not text:
@@ -194,8 +285,10 @@ class NewsScraper:
     def test_feed(self, feed_url: str) -> bool:
         """Test if an RSS feed URL is valid and accessible"""
         try:
-            # Try to parse the feed
-            feed = feedparser.parse(feed_url)
+            # Fetch through the shared session (keep-alive, timeout), then parse the bytes
+            response = self.session.get(feed_url, timeout=self.timeout)
+            response.raise_for_status()
+            feed = feedparser.parse(response.content)
             
             # Check if feed has entries and basic structure
             if hasattr(feed, 'entries') and len(feed.entries) > 0:
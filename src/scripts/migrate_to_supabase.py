@@ -1,5 +1,9 @@
 import sqlite3
 import os
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 from supabase import create_client, Client
 from news_database import NewsDatabase
 import logging
@@ -10,6 +14,11 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Rows per insert request; PostgREST takes a JSON array and inserts it in one statement
+BATCH_SIZE = 500
+# Batch requests in flight at once; the server acknowledging one batch no longer blocks the next
+CONCURRENCY = int(os.getenv('MIGRATION_CONCURRENCY', '8'))
+
 class SupabaseMigrationDatabase:
     def __init__(self):
         """Initialize Supabase client with secret key for migration"""
@@ -22,91 +31,120 @@ class SupabaseMigrationDatabase:
         self.supabase: Client = create_client(self.supabase_url, self.service_role_key)
         logger.info("Supabase migration client initialized with service role")
 
-    def create_user(self, username: str, email: str = None, password_hash: str = None) -> int:
-        """Create a new user using service role"""
-        try:
-            data = {
-                'username': username,
-                'email': email,
-                'password_hash': password_hash
-            }
-            
-            result = self.supabase.table('users').insert(data).execute()
-            user_id = result.data[0]['id']
-            logger.info(f"Created user with ID: {user_id}")
-            return user_id
-            
-        except Exception as e:
-            logger.error(f"Error creating user: {e}")
-            raise
-
-    def add_article(self, title: str, url: str, description: str = None, 
-                   published_date: str = None, source: str = None, 
-                   category: str = None, content_hash: str = None) -> int:
-        """Add a new article"""
-        try:
-            data = {
-                'title': title,
-                'url': url,
-                'description': description,
-                'published_date': published_date,
-                'source': source,
-                'category': category,
-                'content_hash': content_hash
-            }
-            
-            result = self.supabase.table('articles').insert(data).execute()
-            article_id = result.data[0]['id']
-            logger.info(f"Added article with ID: {article_id}")
-            return article_id
-            
-        except Exception as e:
-            if "duplicate key" in str(e).lower():
-                logger.debug(f"Article already exists: {url}")
-                return None
-            logger.error(f"Error adding article: {e}")
-            return None
-
-    def add_user_preference_with_embedding(self, username: str, description: str, weight: float = 1.0):
-        """Add user preference"""
-        try:
-            # Get user ID
-            user_result = self.supabase.table('users').select('id').eq('username', username).execute()
-            if not user_result.data:
-                raise ValueError(f"User not found: {username}")
-            
-            user_id = user_result.data[0]['id']
-            
-            data = {
-                'user_id': user_id,
-                'description': description,
-                'weight': weight
-            }
-            
-            result = self.supabase.table('user_preferences').insert(data).execute()
-            logger.info(f"Added preference for user: {username}")
-            return result.data[0]['id']
-            
-        except Exception as e:
-            logger.error(f"Error adding user preference: {e}")
-            raise
-    def add_reading_history(self, user_id: int, article_id: int, action: str, timestamp: str = None):
-        """Add reading history entry"""
-        try:
-            data = {
-                'user_id': user_id,
-                'article_id': article_id,
+    def _insert_chunked(self, table: str, rows: List[Dict], on_conflict: str = None) -> List[Dict]:
+        """Insert rows in requests of BATCH_SIZE, return the inserted rows (with their new ids).
+        
+        With on_conflict, rows clashing on that column are skipped and not returned. A chunk the
+        server rejects is retried row by row, so one bad row only loses itself.
+        """
+        inserted = []
+        for start in range(0, len(rows), BATCH_SIZE):
+            chunk = rows[start:start + BATCH_SIZE]
+            try:
+                inserted += self._insert(table, chunk, on_conflict)
+            except Exception as e:
+                logger.warning(f"Bulk insert into {table} failed ({e}), retrying {len(chunk)} rows one at a time")
+                for row in chunk:
+                    try:
+                        inserted += self._insert(table, [row], on_conflict)
+                    except Exception as e:
+                        logger.error(f"Error inserting into {table}: {e}")
+        return inserted
+
+    def _insert(self, table: str, rows: List[Dict], on_conflict: str = None) -> List[Dict]:
+        """Insert rows in one request"""
+        query = self.supabase.table(table)
+        if on_conflict:
+            query = query.upsert(rows, on_conflict=on_conflict, ignore_duplicates=True)
+        else:
+            query = query.insert(rows)
+        return query.execute().data
+
+    def create_users(self, users: List[Dict]) -> Dict[str, int]:
+        """Create users (username, email, password_hash dicts), return username -> new user id"""
+        created = self._insert_chunked('users', users)
+        logger.info(f"Created {len(created)} users")
+        return {row['username']: row['id'] for row in created}
+
+    def add_articles(self, articles: List[Dict]) -> Dict[str, int]:
+        """Add articles, skipping urls that already exist, return url -> new article id"""
+        added = self._insert_chunked('articles', articles, on_conflict='url')
+        logger.info(f"Added {len(added)} of {len(articles)} articles")
+        return {row['url']: row['id'] for row in added}
+
+    def add_user_preferences(self, preferences: List[Dict]) -> int:
+        """Add preferences (user_id, description, weight dicts), return how many were added"""
+        return len(self._insert_chunked('user_preferences', preferences))
+
+    def add_reading_history(self, entries: List[Dict]) -> int:
+        """Add reading history entries (user_id, article_id, action, timestamp dicts), return how many were added"""
+        return len(self._insert_chunked('reading_history', entries))
+
+def _batches(cursor: sqlite3.Cursor):
+    """Yield the cursor's remaining rows BATCH_SIZE at a time, without loading the whole result"""
+    return iter(lambda: cursor.fetchmany(BATCH_SIZE), [])
+
+def _map_bounded(executor: Executor, fn: Callable, items: Iterable, limit: int = CONCURRENCY) -> Iterator:
+    """Like executor.map, in order, but with at most `limit` calls in flight so `items` is read lazily"""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def _article_rows(articles: List[tuple]) -> Tuple[List[Dict], Dict[str, int]]:
+    """Convert SQLite article rows to Supabase rows, also returning url -> old_article_id"""
+    rows = []
+    old_article_ids = {}
+    for old_article_id, title, url, description, published_date, source, category, content_hash in articles:
+        if isinstance(published_date, int):
+            # SQLite stores unix seconds; Supabase expects an ISO timestamp
+            published_date = datetime.fromtimestamp(published_date, timezone.utc).isoformat()
+        if isinstance(content_hash, bytes):
+            # SQLite stores the raw digest; Supabase keeps it as hex text
+            content_hash = content_hash.hex()
+        old_article_ids[url] = old_article_id
+        rows.append({
+            'title': title,
+            'url': url,
+            'description': description,
+            'published_date': published_date,
+            'source': source,
+            'category': category,
+            'content_hash': content_hash
+        })
+    return rows, old_article_ids
+
+def _preference_rows(preferences: List[tuple], user_id_mapping: Dict[str, int]) -> List[Dict]:
+    """Convert SQLite preference rows to Supabase rows owned by the migrated users"""
+    rows = []
+    for username, description, weight in preferences:
+        if username in user_id_mapping:
+            rows.append({'user_id': user_id_mapping[username], 'description': description, 'weight': weight})
+        else:
+            logger.error(f"Error migrating preference for {username}: user was not migrated")
+    return rows
+
+def _history_rows(reading_history: List[tuple], user_id_mapping: Dict[str, int],
+                  article_id_mapping: Dict[int, int]) -> List[Dict]:
+    """Convert SQLite reading history rows to Supabase rows pointing at the migrated users and articles"""
+    rows = []
+    for old_user_id, old_article_id, action, timestamp, username in reading_history:
+        # Get new user_id and article_id from mappings
+        new_user_id = user_id_mapping.get(username)
+        new_article_id = article_id_mapping.get(old_article_id)
+        if new_user_id and new_article_id:
+            rows.append({
+                'user_id': new_user_id,
+                'article_id': new_article_id,
                 'action': action,
                 'timestamp': timestamp
-            }
-            
-            result = self.supabase.table('reading_history').insert(data).execute()
-            logger.info(f"Added reading history for user {user_id}, article {article_id}, action {action}")
-            return result.data[0]['id']
-            
-        except Exception as e:
-            logger.error(f"Error adding reading history: {e}")
-            return None
+            })
+        else:
+            logger.warning(f"Skipping reading history - user or article not found: user={username}, article_id={old_article_id}")
+    return rows
 
 def migrate_sqlite_to_supabase():
     """Migrate data from SQLite to Supabase"""
@@ -117,99 +155,72 @@ def migrate_sqlite_to_supabase():
     
     try:
         conn = sqlite3.connect(sqlite_db.db_path)
+        # 64 MB page cache for the full-table scans below
+        conn.execute("PRAGMA cache_size=-65536")
         cursor = conn.cursor()
-        
-        # Migrate users
-        logger.info("Migrating users...")
-        cursor.execute("SELECT username, email, password_hash FROM users")
-        users = cursor.fetchall()
-        
-        user_id_mapping = {}  # old_username -> new_user_id
-        for user in users:
-            username, email, password_hash = user
-            try:
-                new_user_id = supabase_db.create_user(username, email, password_hash)
-                user_id_mapping[username] = new_user_id
-                logger.info(f"Migrated user: {username}")
-            except Exception as e:
-                logger.error(f"Error migrating user {username}: {e}")
-        
-        # Remove the breakpoint
-        # breakpoint()  # Remove this line
-        
-        # Migrate articles
-        logger.info("Migrating articles...")
-        cursor.execute("SELECT id, title, url, description, published_date, source, category, content_hash FROM articles")
-        articles = cursor.fetchall()
-        
-        article_id_mapping = {}  # old_article_id -> new_article_id
-        article_count = 0
-        for article in articles:
-            old_article_id, title, url, description, published_date, source, category, content_hash = article
-            try:
-                new_article_id = supabase_db.add_article(title, url, description, published_date, source, category, content_hash)
-                if new_article_id:
-                    article_id_mapping[old_article_id] = new_article_id
-                    article_count += 1
-            except Exception as e:
-                logger.error(f"Error migrating article {title}: {e}")
-        
-        logger.info(f"Migrated {article_count} articles")
-        
-        # Migrate user preferences
-        logger.info("Migrating user preferences...")
-        cursor.execute("""
-            SELECT u.username, up.description, up.weight 
-            FROM user_preferences up 
-            JOIN users u ON up.user_id = u.id
-        """)
-        preferences = cursor.fetchall()
-        
-        pref_count = 0
-        for pref in preferences:
-            username, description, weight = pref
-            try:
-                supabase_db.add_user_preference_with_embedding(username, description, weight)
-                pref_count += 1
-            except Exception as e:
-                logger.error(f"Error migrating preference for {username}: {e}")
-        
-        logger.info(f"Migrated {pref_count} user preferences")
-        
-        # Migrate reading history
-        logger.info("Migrating reading history...")
-        
-        # Check if reading_history table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='reading_history'")
-        if cursor.fetchone():
+        # Batches of one table go out concurrently; each table finishes before the next starts,
+        # since preferences and history need the ids of the users and articles before them
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+            # Migrate users
+            logger.info("Migrating users...")
+            cursor.execute("SELECT username, email, password_hash FROM users")
+            
+            user_id_mapping = {}  # old_username -> new_user_id
+            user_batches = ([
+                {'username': username, 'email': email, 'password_hash': password_hash}
+                for username, email, password_hash in users
+            ] for users in _batches(cursor))
+            for created in _map_bounded(executor, supabase_db.create_users, user_batches):
+                user_id_mapping.update(created)
+            
+            # Migrate articles
+            logger.info("Migrating articles...")
+            cursor.execute("SELECT id, title, url, description, published_date, source, category, content_hash FROM articles")
+            
+            def add_articles(batch):
+                rows, old_article_ids = batch
+                return old_article_ids, supabase_db.add_articles(rows)
+            
+            article_id_mapping = {}  # old_article_id -> new_article_id
+            for old_article_ids, added in _map_bounded(executor, add_articles, map(_article_rows, _batches(cursor))):
+                for url, new_id in added.items():
+                    article_id_mapping[old_article_ids[url]] = new_id
+            
+            logger.info(f"Migrated {len(article_id_mapping)} articles")
+            
+            # Migrate user preferences
+            logger.info("Migrating user preferences...")
             cursor.execute("""
-                SELECT rh.user_id, rh.article_id, rh.action, rh.timestamp,
-                       u.username
-                FROM reading_history rh
-                JOIN users u ON rh.user_id = u.id
+                SELECT u.username, up.description, up.weight 
+                FROM user_preferences up 
+                JOIN users u ON up.user_id = u.id
             """)
-            reading_history = cursor.fetchall()
             
-            history_count = 0
-            for history in reading_history:
-                old_user_id, old_article_id, action, timestamp, username = history
-                
-                # Get new user_id and article_id from mappings
-                new_user_id = user_id_mapping.get(username)
-                new_article_id = article_id_mapping.get(old_article_id)
-                breakpoint()
-                if new_user_id and new_article_id:
-                    try:
-                        supabase_db.add_reading_history(new_user_id, new_article_id, action, timestamp)
-                        history_count += 1
-                    except Exception as e:
-                        logger.error(f"Error migrating reading history for user {username}: {e}")
-                else:
-                    logger.warning(f"Skipping reading history - user or article not found: user={username}, article_id={old_article_id}")
+            preference_batches = (_preference_rows(preferences, user_id_mapping) for preferences in _batches(cursor))
+            pref_count = sum(_map_bounded(executor, supabase_db.add_user_preferences, preference_batches))
             
-            logger.info(f"Migrated {history_count} reading history entries")
-        else:
-            logger.info("No reading_history table found in SQLite database")
+            logger.info(f"Migrated {pref_count} user preferences")
+            
+            # Migrate reading history
+            logger.info("Migrating reading history...")
+            
+            # Check if reading_history table exists
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='reading_history'")
+            if cursor.fetchone():
+                cursor.execute("""
+                    SELECT rh.user_id, rh.article_id, rh.action, rh.timestamp,
+                           u.username
+                    FROM reading_history rh
+                    JOIN users u ON rh.user_id = u.id
+                """)
+                
+                history_batches = (_history_rows(reading_history, user_id_mapping, article_id_mapping)
+                                   for reading_history in _batches(cursor))
+                history_count = sum(_map_bounded(executor, supabase_db.add_reading_history, history_batches))
+                
+                logger.info(f"Migrated {history_count} reading history entries")
+            else:
+                logger.info("No reading_history table found in SQLite database")
         
         conn.close()
         logger.info("Migration completed successfully!")
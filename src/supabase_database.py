@@ -1,18 +1,28 @@
 import os
 import logging
 from datetime import datetime
-from typing import List, Optional, Dict, Any, Tuple
+from typing import Iterator, List, Optional, Dict, Any, Tuple
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import json
-import hashlib
+import numpy as np
+from collections import Counter
+import xxhash
 from dataclasses import dataclass
-from embedding_service import EmbeddingService
+from functools import cached_property
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+def pgvector_literal(embedding) -> str:
+    """Format an embedding as pgvector's text input, '[x1,x2,...]'.
+    
+    Sent as a string, each component costs ~11 bytes at 7 significant digits (ample for float32
+    cosine) instead of the ~19 that JSON-encoding tolist()'s float64 values takes.
+    """
+    return '[' + ','.join([format(x, '.7g') for x in embedding]) + ']'
+
 @dataclass
 class NewsArticle:
     title: str
@@ -42,8 +52,17 @@ class SupabaseDatabase:
             raise ValueError("Supabase credentials not found in environment variables")
         
         self.supabase: Client = create_client(self.supabase_url, self.supabase_secret_key)
-        self.embedding_service = EmbeddingService()
         logger.info("Supabase client initialized")
+        
+        # Feed ETag/Last-Modified validators are stored in feed_cache (supabase/migrations/*_feed_cache.sql);
+        # this copy keeps conditional GETs working within the process if that table is missing
+        self._feed_validators: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+
+    @cached_property
+    def embedding_service(self):
+        """Load the embedding model on first use, so commands that never embed start quickly"""
+        from embedding_service import EmbeddingService
+        return EmbeddingService()
 
     # User management
     def create_user(self, username: str, email: Optional[str] = None, password_hash: Optional[str] = None) -> int:
@@ -74,24 +93,46 @@ class SupabaseDatabase:
             return None
 
     # Article management
-    # Modified add_article method to accept NewsArticle object
+    def _content_hash(self, article: NewsArticle) -> str:
+        """Hash the identifying fields of an article for duplicate detection"""
+        hasher = xxhash.xxh3_128()
+        hasher.update((article.title or '').encode())
+        hasher.update((article.url or '').encode())
+        hasher.update((article.description or '').encode())
+        return hasher.hexdigest()
+
+    def _drop_known_articles(self, articles: List[NewsArticle]) -> List[NewsArticle]:
+        """Return the articles whose url is not stored yet, before any embedding work is spent on them"""
+        urls = list({a.url for a in articles})
+        known = set()
+        # The urls travel in the request's query string, so look them up a hundred at a time
+        for start in range(0, len(urls), 100):
+            result = self.supabase.table('articles').select('url').in_('url', urls[start:start + 100]).execute()
+            known.update(row['url'] for row in result.data)
+        
+        return [a for a in articles if a.url not in known]
+
     def add_article(self, article: NewsArticle) -> bool:
         """Add a new article to the database with embedding, return True if added, False if duplicate"""
-        try:
-            # Generate content hash to avoid duplicates
-            content_for_hash = f"{article.title}{article.url}{article.description}"
-            article.content_hash = hashlib.md5(content_for_hash.encode()).hexdigest()
-            
-            # Generate embedding
-            embedding_array = self.embedding_service.create_article_embedding(
-                article.title, article.description, article.category
-            )
-            
-            # Convert numpy array to list for pgvector
-            article.embedding = embedding_array.tolist() if embedding_array is not None else None
-            # breakpoint()
+        return self.add_articles([article]) == 1
+
+    def add_articles(self, articles: List[NewsArticle]) -> int:
+        """Add a batch of articles with embeddings in one request, return the number of new articles;
+        errors propagate, so callers never mistake a failed write for a batch of duplicates"""
+        articles = self._drop_known_articles(articles)
+        if not articles:
+            return 0
+        
+        embeddings = self.embedding_service.create_article_embedding_batch(
+            [a.title for a in articles], [a.description for a in articles], [a.category for a in articles]
+        )
+        
+        rows = []
+        for article, embedding_array in zip(articles, embeddings):
+            article.content_hash = self._content_hash(article)
+            article.embedding = embedding_array.tolist()
             
-            data = {
+            rows.append({
                 'title': article.title,
                 'url': article.url,
                 'description': article.description,
@@ -100,19 +141,15 @@ class SupabaseDatabase:
                 'source': article.source,
                 'category': article.category,
                 'content_hash': article.content_hash,
-                'embedding': article.embedding  # Store as list, pgvector will handle conversion
-            }
-            
-            result = self.supabase.table('articles').insert(data).execute()
-            logger.info(f"Added article with ID: {result.data[0]['id']}")
-            return True
-            
-        except Exception as e:
-            if "duplicate key" in str(e).lower():
-                logger.debug(f"Article already exists: {article.url}")
-                return False
-            logger.error(f"Error adding article: {e}")
-            return False
+                'embedding': pgvector_literal(article.embedding)
+            })
+        
+        # ON CONFLICT DO NOTHING: only newly inserted rows come back in result.data
+        result = self.supabase.table('articles').upsert(
+            rows, on_conflict='url', ignore_duplicates=True
+        ).execute()
+        logger.info(f"Added {len(result.data)} of {len(rows)} articles")
+        return len(result.data)
 
     def get_latest_articles(self, limit: int = 50) -> List[NewsArticle]:
         """Get the latest articles from the database"""
@@ -140,6 +177,36 @@ class SupabaseDatabase:
             logger.error(f"Error getting latest articles: {e}")
             return []
 
+    def iter_latest_articles(self, limit: int = 50, chunk_size: int = 256) -> Iterator[NewsArticle]:
+        """Yield the latest articles, fetching them a page at a time"""
+        offset = 0
+        while offset < limit:
+            end = min(offset + chunk_size, limit) - 1
+            try:
+                result = self.supabase.table('articles').select('*').order('published_date', desc=True).range(offset, end).execute()
+            except Exception as e:
+                logger.error(f"Error getting latest articles: {e}")
+                return
+            
+            for row in result.data:
+                yield NewsArticle(
+                    title=row['title'],
+                    url=row['url'],
+                    description=row['description'],
+                    content=row.get('content', ''),
+                    published_date=datetime.fromisoformat(row['published_date']) if row['published_date'] else None,
+                    source=row['source'],
+                    category=row['category'],
+                    content_hash=row.get('content_hash'),
+                    is_read=row.get('is_read', False),
+                    user_rating=row.get('user_rating'),
+                    embedding=row.get('embedding')
+                )
+            
+            if len(result.data) < end - offset + 1:
+                return
+            offset = end + 1
+
     def get_articles_by_source(self, source: str, limit: int = 20) -> List[NewsArticle]:
         """Get articles by source"""
         try:
@@ -226,6 +293,12 @@ class SupabaseDatabase:
     # User preferences
     def add_user_preference_with_embedding(self, username: str, description: str, weight: float = 1.0):
         """Add user preference with embedding"""
+        return self.add_user_preferences_with_embeddings(username, [(description, weight)])[0]
+    
+    def add_user_preferences_with_embeddings(self, username: str, preferences: List[Tuple[str, float]]) -> List[int]:
+        """Add several (description, weight) preferences, embedding them in one batch and inserting them in one request"""
+        if not preferences:
+            return []
         try:
             # Get user ID
             user = self.get_user_by_username(username)
@@ -234,20 +307,21 @@ class SupabaseDatabase:
             else:
                 user_id = user['id']
             
-            # Generate embedding for the preference
-            embedding_array = self.embedding_service.create_preference_embedding(description)
-            embedding_list = embedding_array.tolist() if embedding_array is not None else None
+            # Generate embeddings for all preferences with one model call
+            embeddings = self.embedding_service.create_preference_embedding_batch(
+                [description for description, _ in preferences]
+            )
             
-            data = {
+            data = [{
                 'user_id': user_id,
                 'description': description,
                 'weight': weight,
-                'embedding': embedding_list  # Store as list for pgvector
-            }
+                'embedding': pgvector_literal(embedding.tolist())
+            } for (description, weight), embedding in zip(preferences, embeddings)]
             
             result = self.supabase.table('user_preferences').insert(data).execute()
-            logger.info(f"Added preference for user: {username}")
-            return result.data[0]['id']
+            logger.info(f"Added {len(data)} preference(s) for user: {username}")
+            return [row['id'] for row in result.data]
             
         except Exception as e:
             logger.error(f"Error adding user preference: {e}")
@@ -346,6 +420,66 @@ class SupabaseDatabase:
             logger.error(f"Error getting article count: {e}")
             return 0
 
+    def get_recent_article_count(self, since: datetime) -> int:
+        """Get number of articles published after the given time"""
+        try:
+            result = self.supabase.table('articles').select('id', count='exact').gt('published_date', since.isoformat()).limit(1).execute()
+            return result.count
+        except Exception as e:
+            logger.error(f"Error getting recent article count: {e}")
+            return 0
+
+    def get_top_sources(self, since: datetime, limit: int = 5) -> List[Tuple[str, int]]:
+        """Get the sources with the most articles published after the given time"""
+        try:
+            result = self.supabase.table('articles').select('source').gt('published_date', since.isoformat()).execute()
+            return Counter(row['source'] for row in result.data).most_common(limit)
+        except Exception as e:
+            logger.error(f"Error getting top sources: {e}")
+            return []
+
+    def get_stats(self, since: datetime, top_sources: int = 5) -> Tuple[int, int, List[Tuple[str, int]]]:
+        """Get (total articles, articles published after `since`, top sources since then).
+        
+        Aggregates in Postgres with the news_stats RPC (supabase/migrations/*_news_stats.sql); if the
+        function is not installed, falls back to the separate count and source queries.
+        """
+        try:
+            stats = self.supabase.rpc('news_stats', {'since': since.isoformat(), 'top_n': top_sources}).execute().data
+            return stats['total'], stats['recent'], [(row['source'], row['count']) for row in stats['top_sources']]
+        except Exception as e:
+            logger.warning(f"news_stats RPC unavailable, counting with table queries: {e}")
+            return self.get_total_articles(), self.get_recent_article_count(since), self.get_top_sources(since, top_sources)
+
+    def get_feed_validators(self, feed_url: str) -> Tuple[Optional[str], Optional[str]]:
+        """Get the (ETag, Last-Modified) pair stored for a feed from its last successful scrape"""
+        try:
+            result = self.supabase.table('feed_cache').select('etag, last_modified').eq('feed_url', feed_url).execute()
+            if result.data:
+                return result.data[0]['etag'], result.data[0]['last_modified']
+            return None, None
+        except Exception as e:
+            logger.warning(f"Error reading feed validators, using this process's copy: {e}")
+            return self._feed_validators.get(feed_url, (None, None))
+
+    def set_feed_validators(self, feed_url: str, etag: Optional[str], last_modified: Optional[str]):
+        """Remember the ETag and Last-Modified headers a feed was last fetched with"""
+        self._feed_validators[feed_url] = (etag, last_modified)
+        try:
+            self.supabase.table('feed_cache').upsert(
+                {'feed_url': feed_url, 'etag': etag, 'last_modified': last_modified}, on_conflict='feed_url'
+            ).execute()
+        except Exception as e:
+            logger.warning(f"Error saving feed validators: {e}")
+
+    def analyze(self):
+        """Planner statistics are maintained server-side by Postgres autovacuum; nothing to do"""
+        pass
+
+    def maintenance(self):
+        """Vacuuming and reindexing are handled server-side by Postgres; nothing to do"""
+        pass
+
     def get_articles_by_date_range(self, start_date: str, end_date: str) -> List[Dict]:
         """Get articles within date range"""
         try:
@@ -356,63 +490,64 @@ class SupabaseDatabase:
             return []
 
     def get_personalized_articles(self, username: str, limit: int = 20) -> List[Tuple[NewsArticle, float]]:
-        """Get articles ranked by user preferences using vector similarity"""
+        """Get articles ranked by user preferences using vector similarity.
+        
+        The match_articles RPC (supabase/migrations/*_match_articles.sql) folds the user's weighted
+        preference embeddings into a query vector and runs the top-k cosine search in Postgres, so
+        neither preference nor article embeddings cross the network. If the function is not
+        installed, the query vector is built here and searched with find_similar_articles instead.
+        """
+        try:
+            result = self.supabase.rpc('match_articles', {
+                'uname': username,
+                'match_threshold': 0.5,
+                'match_count': limit
+            }).execute()
+            rows = result.data
+        except Exception as e:
+            logger.warning(f"match_articles RPC unavailable, ranking with client-side query vector: {e}")
+            return self._get_personalized_articles_client_side(username, limit)
+        
+        if not rows:
+            # Unknown user, no preferences yet or nothing close enough: show the latest articles
+            return [(article, 0.0) for article in self.get_latest_articles(limit)]
+        
+        return [(NewsArticle(
+            title=row['title'],
+            url=row['url'],
+            description=row['description'],
+            content=row.get('content', ''),
+            published_date=datetime.fromisoformat(row['published_date']) if row['published_date'] else None,
+            source=row['source'],
+            category=row.get('category'),
+            content_hash=row.get('content_hash')
+        ), row['similarity']) for row in rows]
+
+    def _get_personalized_articles_client_side(self, username: str, limit: int) -> List[Tuple[NewsArticle, float]]:
+        """Rank articles by downloading the user's preference embeddings and searching with their weighted average"""
         try:
             user = self.get_user_by_username(username)
             if not user:
                 return [(article, 0.0) for article in self.get_latest_articles(limit)]
             
             # Get user preferences with embeddings
-            preferences_result = self.supabase.table('user_preferences').select('embedding, weight').eq('user_id', user['id']).not_('embedding', 'is', None).execute()
-            
-            if not preferences_result.data:
-                return [(article, 0.0) for article in self.get_latest_articles(limit)]
-            
-            # Calculate average preference vector
-            preference_vectors = []
-            weights = []
-            for row in preferences_result.data:
-                if row['embedding']:
-                    preference_vectors.append(row['embedding'])
-                    weights.append(row['weight'])
+            preferences_result = self.supabase.table('user_preferences').select('embedding, weight').eq('user_id', user['id']).execute()
             
-            if not preference_vectors:
+            # Stack preferences into a (P, D) matrix; pgvector columns may arrive as '[...]' text
+            rows = [row for row in preferences_result.data if row['embedding']]
+            if not rows:
                 return [(article, 0.0) for article in self.get_latest_articles(limit)]
             
-            # Calculate weighted average of preference vectors
-            weighted_prefs = []
-            for i, vec in enumerate(preference_vectors):
-                weighted_vec = [val * weights[i] for val in vec]
-                weighted_prefs.append(weighted_vec)
-            
-            # Average the weighted preferences
-            avg_pref = [sum(vals) / len(vals) for vals in zip(*weighted_prefs)]
-            
-            # Use pgvector similarity search
-            result = self.supabase.rpc('find_similar_articles', {
-                'query_embedding': avg_pref,
-                'match_threshold': 0.5,
-                'match_count': limit
-            }).execute()
+            preference_matrix = np.array(
+                [json.loads(row['embedding']) if isinstance(row['embedding'], str) else row['embedding'] for row in rows],
+                dtype=np.float32
+            )
+            weights = np.array([row['weight'] for row in rows], dtype=np.float32)
             
-            articles = []
-            for row in result.data:
-                article = NewsArticle(
-                    title=row['title'],
-                    url=row['url'],
-                    description=row['description'],
-                    content=row.get('content', ''),
-                    published_date=datetime.fromisoformat(row['published_date']) if row['published_date'] else None,
-                    source=row['source'],
-                    category=row.get('category'),
-                    content_hash=row.get('content_hash'),
-                    is_read=row.get('is_read', False),
-                    user_rating=row.get('user_rating'),
-                    embedding=row.get('embedding')
-                )
-                articles.append((article, row['similarity']))
+            # Weighted average of preference vectors in one matrix-vector product
+            avg_pref = (weights @ preference_matrix / len(rows)).tolist()
             
-            return articles
+            return self.find_similar_articles(avg_pref, limit)
             
         except Exception as e:
             logger.error(f"Error getting personalized articles: {e}")
@@ -438,6 +573,10 @@ class SupabaseDatabase:
 
     def add_reading_history(self, username: str, article_id: int, action: str):
         """Add reading history for a specific user"""
+        self.add_reading_history_batch(username, [article_id], action)
+
+    def add_reading_history_batch(self, username: str, article_ids: List[int], action: str):
+        """Add the same reading history action for several articles with one insert"""
         try:
             user = self.get_user_by_username(username)
             if not user:
@@ -445,18 +584,30 @@ class SupabaseDatabase:
             else:
                 user_id = user['id']
             
-            data = {
-                'user_id': user_id,
-                'article_id': article_id,
-                'action': action
-            }
+            data = [
+                {
+                    'user_id': user_id,
+                    'article_id': article_id,
+                    'action': action
+                }
+                for article_id in article_ids
+            ]
             
             result = self.supabase.table('reading_history').insert(data).execute()
-            logger.info(f"Added reading history for user: {username}")
+            logger.info(f"Added {len(data)} reading history entries for user: {username}")
             
         except Exception as e:
             logger.error(f"Error adding reading history: {e}")
 
+    def get_article_ids_by_url(self, urls: List[str]) -> Dict[str, int]:
+        """Map each stored url among `urls` to its article id; unknown urls are left out"""
+        try:
+            result = self.supabase.table('articles').select('id, url').in_('url', list(dict.fromkeys(urls))).execute()
+            return {row['url']: row['id'] for row in result.data}
+        except Exception as e:
+            logger.error(f"Error looking up articles by url: {e}")
+            return {}
+
     def get_article_count(self) -> int:
         """Get total number of articles in database (alias for get_total_articles)"""
         return self.get_total_articles()
@@ -0,0 +1,15 @@
+"""WSGI entry point for running the API under a production server.
+
+    cd src
+    gunicorn -w 1 --threads 16 -b 0.0.0.0:5002 wsgi:app
+
+Keep a single worker process: each worker imports app.py, which starts its
+own background scraping scheduler and holds its own in-process caches, so
+more workers would mean duplicate scrapes and caches that never see each
+other's invalidations. Scale with --threads instead; the SQLite connection
+pool and the caches are thread-safe, and the embedding model releases the
+GIL while encoding.
+"""
+from app import app
+
+__all__ = ['app']
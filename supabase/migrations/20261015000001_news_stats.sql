@@ -0,0 +1,21 @@
+-- Aggregates for SupabaseDatabase.get_stats(): total articles, articles published after
+-- `since`, and the `top_n` busiest sources since then, in one round trip
+CREATE OR REPLACE FUNCTION news_stats(since timestamptz, top_n int)
+RETURNS json
+LANGUAGE sql STABLE
+AS $$
+  SELECT json_build_object(
+    'total', (SELECT count(*) FROM articles),
+    'recent', (SELECT count(*) FROM articles WHERE published_date > since),
+    'top_sources', coalesce((
+      SELECT json_agg(s) FROM (
+        SELECT source, count(*) AS count
+        FROM articles
+        WHERE published_date > since
+        GROUP BY source
+        ORDER BY count(*) DESC
+        LIMIT top_n
+      ) s
+    ), '[]'::json)
+  );
+$$;
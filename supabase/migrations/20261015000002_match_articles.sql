@@ -0,0 +1,41 @@
+-- Ranked recommendations for SupabaseDatabase.get_personalized_articles(): folds the user's
+-- weighted preference embeddings into one query vector and runs a top-k cosine search
+
+-- Requires articles.embedding to be a fixed-size vector(n) column, n = the embedding model's
+-- output size (or EMBEDDING_TRUNCATE_DIM when set)
+CREATE INDEX IF NOT EXISTS articles_embedding_hnsw ON articles USING hnsw (embedding vector_cosine_ops);
+
+CREATE OR REPLACE FUNCTION match_articles(uname text, match_threshold float, match_count int)
+RETURNS TABLE(title text, url text, description text, content text, published_date timestamptz,
+              source text, category text, content_hash text, similarity float)
+LANGUAGE plpgsql STABLE
+AS $$
+DECLARE
+  -- Unsized, so the function follows whatever dimension the stored embeddings have
+  q vector;
+BEGIN
+  -- Weighted sum of the preference vectors; cosine ignores the scale
+  SELECT array_agg(c.x ORDER BY c.i)::vector INTO q
+  FROM (
+    SELECT e.i, sum(e.x * p.weight) AS x
+    FROM users u
+    JOIN user_preferences p ON p.user_id = u.id,
+         unnest(p.embedding::real[]) WITH ORDINALITY AS e(x, i)
+    WHERE u.username = uname AND p.embedding IS NOT NULL
+    GROUP BY e.i
+  ) c;
+  
+  IF q IS NULL THEN
+    RETURN;
+  END IF;
+  
+  -- Threshold before LIMIT, so up to match_count qualifying articles come back
+  RETURN QUERY
+  SELECT a.title, a.url, a.description, a.content, a.published_date, a.source, a.category,
+         a.content_hash, 1 - (a.embedding <=> q) AS similarity
+  FROM articles a
+  WHERE a.embedding IS NOT NULL AND a.embedding <=> q <= 1 - match_threshold
+  ORDER BY a.embedding <=> q
+  LIMIT match_count;
+END
+$$;
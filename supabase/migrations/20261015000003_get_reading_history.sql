@@ -0,0 +1,12 @@
+-- Newest-first reading history joined to article details for GET /api/user/reading-history
+CREATE OR REPLACE FUNCTION get_reading_history(uid bigint, lim int)
+RETURNS TABLE(title text, url text, source text, action text, "timestamp" timestamptz)
+LANGUAGE sql STABLE
+AS $$
+  SELECT a.title, a.url, a.source, rh.action, rh.timestamp
+  FROM reading_history rh
+  JOIN articles a ON a.id = rh.article_id
+  WHERE rh.user_id = uid
+  ORDER BY rh.timestamp DESC
+  LIMIT lim;
+$$;
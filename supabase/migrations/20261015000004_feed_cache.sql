@@ -0,0 +1,7 @@
+-- HTTP validators per feed (SupabaseDatabase.get/set_feed_validators), so a scrape can skip
+-- feeds that have not changed with a conditional GET; mirrors feed_cache in the SQLite schema
+CREATE TABLE IF NOT EXISTS feed_cache (
+  feed_url text PRIMARY KEY,
+  etag text,
+  last_modified text
+);